@@ -1,10 +1,232 @@
 import random
 import copy
+import multiprocessing
+import threading
 import time
-import hashlib
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeout, wait
+from multiprocessing import shared_memory
+import engine
+from transposition import TranspositionTable, PawnHashTable, EvalCache, EXACT, LOWER, UPPER
+
+# Search score bounds: a lost king scores -MATE_SCORE plus the plies it took,
+# and INFINITY sits outside every reachable score
+MATE_SCORE = 100000
+INFINITY = 1000000
+
+# Deepest ply with killer slots, and the history score that triggers halving
+MAX_PLY = 64
+HISTORY_MAX = 400
+
+# Half-width of the first aspiration window around the last iteration's
+# score; past ASPIRATION_MAX the window opens fully
+ASPIRATION_WINDOW = 50
+ASPIRATION_MAX = 1000
+
+# Lazy SMP shared memory starts with a stop flag byte, padded so the
+# transposition table after it stays 8-byte aligned
+SMP_HEADER_BYTES = 8
+
+# Seconds past a search's deadline to wait for a helper process to notice
+# the stop flag before giving up on its result
+HELPER_GRACE = 0.5
+
+# Positions with this many pieces or fewer are scored and searched as endgames
+ENDGAME_PIECES = 12
+
+
+class SearchCancelled(Exception):
+    """Raised inside negamax/quiescence_search once the search's deadline fires."""
+
+
+class Deadline:
+    """Cooperative stop signal shared by a search and whoever started it.
+
+    The search polls ``expired()`` every few thousand nodes; another thread
+    can end it early with ``cancel()``, which also raises the stop flags of
+    any helper processes searching under it.
+    """
+
+    def __init__(self, seconds=None):
+        self.expires_at = None if seconds is None else time.time() + seconds
+        self._cancelled = threading.Event()
+        # Shared memory whose first byte stops helper processes, and the lock
+        # that keeps cancel() from writing to one after it is closed
+        self._stop_flags = []
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled.set()
+            for shm in self._stop_flags:
+                shm.buf[0] = 1
+
+    def add_stop_flag(self, shm):
+        """Raise ``shm``'s stop flag when this deadline is cancelled (at once if it already is)."""
+        with self._lock:
+            if self._cancelled.is_set():
+                shm.buf[0] = 1
+            self._stop_flags.append(shm)
+
+    def remove_stop_flag(self, shm):
+        with self._lock:
+            if shm in self._stop_flags:
+                self._stop_flags.remove(shm)
+
+    def expired(self):
+        return self._cancelled.is_set() or (self.expires_at is not None and time.time() >= self.expires_at)
+
+    def within(self, seconds):
+        """A deadline ``seconds`` from now, never later than this one, cancelled along with it."""
+        child = Deadline(seconds)
+        child._cancelled = self._cancelled
+        child._stop_flags = self._stop_flags
+        child._lock = self._lock
+        if self.expires_at is not None:
+            child.expires_at = min(child.expires_at, self.expires_at)
+        return child
+
+
+class SharedStop:
+    """Deadline for a helper process: the shared stop flag or the search's own expiry."""
+
+    def __init__(self, flag, expires_at=None):
+        self.flag = flag
+        self.expires_at = expires_at
+
+    def expired(self):
+        return bool(self.flag[0]) or (self.expires_at is not None and time.time() >= self.expires_at)
+
+
+# One pool of helper processes, started by start_search_pool or on first use
+# and grown as needed, and how many of them searches have claimed
+_smp_executor = None
+_smp_executor_size = 0
+_smp_executor_busy = 0
+_smp_executor_lock = threading.Lock()
+
+# Each helper process loads one ChessAI when it starts and keeps it, so its
+# tables, killers and history carry over between searches like the main
+# process's do; _helper_search is the search they were last cleared for
+_helper_ai = None
+_helper_search = None
+
+
+def _start_helper():
+    global _helper_ai
+    _helper_ai = ChessAI('hard')
+    # Lazy SMP helpers search the main process's shared table; a root-split
+    # helper builds a table of its own on its first search
+    _helper_ai.tt = None
+
+
+def _smp_pool(helpers):
+    global _smp_executor, _smp_executor_size
+    with _smp_executor_lock:
+        if _smp_executor is None or _smp_executor_size < helpers:
+            if _smp_executor is not None:
+                _smp_executor.shutdown(wait=False)
+            # Spawned rather than forked: the web server runs request threads
+            _smp_executor = ProcessPoolExecutor(helpers, mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=_start_helper)
+            _smp_executor_size = helpers
+        return _smp_executor
+
+
+def _claim_helpers(wanted):
+    """The pool and how many of its idle processes (up to ``wanted``) a search may use.
+
+    Each claimed process goes back to the pool when the future submitted to
+    it is done; see _submit_helper. Concurrent searches split the idle
+    processes rather than queueing behind each other's helpers.
+    """
+    global _smp_executor_busy
+    pool = _smp_pool(wanted)
+    with _smp_executor_lock:
+        count = max(0, min(wanted, _smp_executor_size - _smp_executor_busy))
+        _smp_executor_busy += count
+    return pool, count
+
+
+def _release_helper(future):
+    global _smp_executor_busy
+    with _smp_executor_lock:
+        _smp_executor_busy -= 1
+
+
+def _submit_helper(pool, func, *args):
+    """Run ``func`` on a helper process claimed with _claim_helpers."""
+    future = pool.submit(func, *args)
+    future.add_done_callback(_release_helper)
+    return future
+
+
+def start_search_pool(workers):
+    """Start the helper processes for ``workers``-process searches ahead of the first one.
+
+    Call once at startup; does nothing for a single worker or inside a
+    helper process.
+    """
+    if workers <= 1 or multiprocessing.parent_process() is not None:
+        return
+    pool = _smp_pool(workers - 1)
+    # Processes start as work arrives, so hand each one something to start on
+    for future in [pool.submit(time.sleep, 0.1) for _ in range(workers - 1)]:
+        future.result()
+
+
+def _lazy_smp_helper(shm_name, tt_bytes, tt_age, board, moves, depths, start_by, expires_at):
+    """Run one Lazy SMP helper's iterative deepening on the shared table.
+
+    Returns (deepest completed depth or None, score, ranked root moves, PV, nodes searched).
+    """
+    ai = _helper_ai
+    shm = shared_memory.SharedMemory(name=shm_name)
+    own_tt = ai.tt
+    try:
+        ai.tt = TranspositionTable(buffer=shm.buf[SMP_HEADER_BYTES:SMP_HEADER_BYTES + tt_bytes])
+        ai._new_search()
+        ai.tt.age = tt_age
+        ai.search_deadline = SharedStop(shm.buf, expires_at)
+        nodes = ai.nodes
+        completed, score, moves = ai._iterative_deepening(board, moves, depths, start_by)
+        return completed, score, moves, ai.pv, ai.nodes - nodes
+    finally:
+        if ai.tt is not own_tt:
+            ai.tt.words.release()
+            ai.tt = own_tt
+        ai.search_deadline = ai.deadline
+        shm.close()
+
+
+def _root_split_helper(stop_name, board, move, depth, alpha, expires_at):
+    """Search one root move of a root-split search with this helper's own tables.
+
+    Returns (score, PV from the move on, nodes searched), or None once the
+    search has been stopped.
+    """
+    global _helper_search
+    ai = _helper_ai
+    stop = shared_memory.SharedMemory(name=stop_name)
+    try:
+        if _helper_search != stop_name:
+            ai._allocate_tables()
+            ai._new_search()
+            _helper_search = stop_name
+        ai.search_deadline = SharedStop(stop.buf, expires_at)
+        ai._attach_tables(board)
+        nodes = ai.nodes
+        try:
+            score, pv = ai._search_root_move(board, move, depth, alpha)
+        except SearchCancelled:
+            return None
+        return score, pv, ai.nodes - nodes
+    finally:
+        ai.search_deadline = ai.deadline
+        stop.close()
+
 
 class ChessAI:
-    def __init__(self, difficulty='medium'):
+    def __init__(self, difficulty='medium', tt_size_mb=16, pawn_hash_size_kb=256, eval_cache_size_kb=256):
         self.difficulty = difficulty
         self.piece_values = {
             'pawn': 100,
@@ -14,6 +236,8 @@ class ChessAI:
             'queen': 900,
             'king': 20000
         }
+        # The same values indexed by engine piece type, for the search
+        self.type_values = [self.piece_values[name] for name in engine.PIECE_TYPES]
         # Position evaluation tables to encourage better piece placement
         self.pawn_table = [
             [ 0,  0,  0,  0,  0,  0,  0,  0],
@@ -92,6 +316,10 @@ class ChessAI:
             [-50,-30,-30,-30,-30,-30,-30,-50]
         ]
         
+        # Material, the tables above and the square-only bonuses summed per
+        # piece code and square, kept current on the search's boards by make_move
+        self.psq_tables = self._piece_square_tables()
+        
         # Time limits for each difficulty level
         self.time_limits = {
             'easy': 0.5,
@@ -106,10 +334,113 @@ class ChessAI:
             'hard': 4  # Increased from 2-3 to 4 for hard mode
         }
         
-        # Transposition table for position caching
-        self.tt = {}
-        # Maximum transposition table size to prevent memory issues
-        self.tt_max_size = 1000000
+        # Transposition table for position caching, fixed in size
+        self.tt_size_mb = tt_size_mb
+        self.tt = None
+        
+        # Pawn-structure terms keyed by the pawns alone, which rarely change
+        self.pawn_hash_size_kb = pawn_hash_size_kb
+        self.pawn_hash = None
+        
+        # Static evaluations of whole positions, for transpositions the
+        # search reaches again by another move order
+        self.eval_cache_size_kb = eval_cache_size_kb
+        self.eval_cache = None
+        
+        # Only hard and grandmaster search, so easy and medium games never
+        # allocate the tables
+        if difficulty in ('hard', 'grandmaster'):
+            self._allocate_tables()
+        
+        # Deadline for the current get_move call and the one minimax polls
+        self.deadline = Deadline()
+        self.search_deadline = self.deadline
+        self.nodes = 0
+        # Nodes between deadline checks (a power of two, used as a mask)
+        self.deadline_check_interval = 2048
+        
+        # Principal variation of the last completed iteration, one encoded move per ply
+        self.pv = []
+        # Key of the position the PV expects after our move and the reply to it
+        self.pv_key = None
+        
+        # Quiet moves that caused beta cutoffs: two killer slots per ply and a
+        # from-square x to-square history table per side, kept across iterations;
+        # 0 is an empty killer slot
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [[0] * 4096 for _ in engine.COLORS]
+        # Beta cutoffs, and how many came from the first move searched
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        
+        # Null-move pruning and late move reductions, with their counters
+        self.null_move_pruning = True
+        self.late_move_reductions = True
+        self.null_move_cutoffs = 0
+        self.reductions = 0
+        self.reduction_researches = 0
+        
+        # Aspiration windows: iterations searched with one, and re-searches
+        # after the score fell below or rose above it
+        self.aspiration_searches = 0
+        self.aspiration_fail_low = 0
+        self.aspiration_fail_high = 0
+        # Quiescence captures skipped for losing material in the exchange
+        self.see_pruned = 0
+        
+        # Frontier pruning, with margins indexed by remaining depth (1 or 2):
+        # futility skips quiet moves when the static eval plus the margin
+        # cannot reach alpha, razoring drops straight into quiescence, and
+        # delta pruning skips quiescence captures whose victim plus the
+        # margin cannot reach alpha
+        self.futility_pruning = True
+        self.razoring = True
+        self.delta_pruning = True
+        self.futility_margins = {1: 200, 2: 500}
+        self.razor_margins = {1: 300, 2: 600}
+        self.delta_margin = 200
+        self.futility_pruned = 0
+        self.razor_cutoffs = 0
+        self.delta_pruned = 0
+        
+        # Processes searching each root in hard and grandmaster mode; 1
+        # searches in this process only. 'lazy' shares one transposition
+        # table between whole searches, 'root' splits the root moves
+        self.smp_workers = 1
+        self.smp_mode = 'lazy'
+        self.helper_nodes = 0
+        
+    def _allocate_tables(self):
+        """Create whichever of the search tables this AI does not have yet."""
+        if self.tt is None:
+            self.tt = TranspositionTable(self.tt_size_mb)
+        if self.pawn_hash is None:
+            self.pawn_hash = PawnHashTable(self.pawn_hash_size_kb)
+        if self.eval_cache is None:
+            self.eval_cache = EvalCache(self.eval_cache_size_kb)
+
+    def search_stats(self):
+        """Counters accumulated by this AI's searches, for benchmarks and logging."""
+        return {
+            'nodes': self.nodes,
+            'cutoffs': self.cutoffs,
+            'first_move_cutoffs': self.first_move_cutoffs,
+            'null_move_cutoffs': self.null_move_cutoffs,
+            'reductions': self.reductions,
+            'reduction_researches': self.reduction_researches,
+            'aspiration_searches': self.aspiration_searches,
+            'aspiration_fail_low': self.aspiration_fail_low,
+            'aspiration_fail_high': self.aspiration_fail_high,
+            'see_pruned': self.see_pruned,
+            'futility_pruned': self.futility_pruned,
+            'razor_cutoffs': self.razor_cutoffs,
+            'delta_pruned': self.delta_pruned,
+            'helper_nodes': self.helper_nodes,
+            'pawn_hash_hits': self.pawn_hash.hits if self.pawn_hash is not None else 0,
+            'pawn_hash_misses': self.pawn_hash.misses if self.pawn_hash is not None else 0,
+            'eval_cache_hits': self.eval_cache.hits if self.eval_cache is not None else 0,
+            'eval_cache_misses': self.eval_cache.misses if self.eval_cache is not None else 0,
+        }
         
     def evaluate_board(self, state):
         """Evaluate the board state from black's perspective"""
@@ -147,259 +478,121 @@ class ChessAI:
                         white_score += 15
         return black_score - white_score
     
+    def _piece_square_tables(self):
+        """Midgame and endgame tables indexed [piece code][square], black positive.
+
+        Each entry is the piece's material value, its placement table entry
+        and the bonuses that depend only on its square: center control and a
+        rook on the opponent's second rank. Only the king's entry differs
+        between the two tables.
+        """
+        tables = []
+        for king_table in (self.king_middle_table, self.king_endgame_table):
+            placement = [self.pawn_table, self.knight_table, self.bishop_table,
+                         self.rook_table, self.queen_table, king_table]
+            table = [[0] * 64 for _ in range(16)]
+            for c in (engine.WHITE, engine.BLACK):
+                sign = 1 if c == engine.BLACK else -1
+                for piece, name in enumerate(engine.PIECE_TYPES):
+                    entries = table[engine.piece_code(c, piece)]
+                    for sq in range(64):
+                        # Tables are laid out from white's side, so black reads them upside down
+                        x, row = sq % 8, sq // 8 if c == engine.WHITE else 7 - sq // 8
+                        value = self.piece_values[name] + placement[piece][row][x]
+                        if engine.CENTER_INNER >> sq & 1:
+                            value += 30
+                        elif engine.CENTER_OUTER >> sq & 1:
+                            value += 15
+                        # Rook on the opponent's second rank is powerful in endgame
+                        if piece == engine.ROOK and row == 6:
+                            value += 40
+                        entries[sq] = sign * value
+            tables.append(table)
+        return tuple(tables)
+
+    def _pawn_structure(self, board):
+        """Passed and connected pawn score (black minus white) and the files without pawns.
+
+        Both depend only on where the pawns stand, so they come from the pawn
+        hash whenever this pawn structure was scored before.
+        """
+        entry = self.pawn_hash.probe(board.pawn_key)
+        if entry is not None:
+            return entry
+        scores = [0, 0]
+        pawns = (board.pieces[engine.WHITE][engine.PAWN], board.pieces[engine.BLACK][engine.PAWN])
+        for c in (engine.WHITE, engine.BLACK):
+            own, enemy = pawns[c], pawns[c ^ 1]
+            score = 0
+            for sq in engine.iter_bits(own):
+                row = sq // 8 if c == engine.WHITE else 7 - sq // 8
+                # Passed pawn detection (no enemy pawns in front)
+                if not engine.PASSED_PAWN_MASKS[c][sq] & enemy:
+                    score += row * 20  # Further advanced passed pawns worth more
+                # Connected pawns bonus
+                score += 15 * engine.popcount(engine.NEIGHBOUR_MASKS[sq] & own)
+            scores[c] = score
+        all_pawns = pawns[engine.WHITE] | pawns[engine.BLACK]
+        open_files = 0
+        for x in range(8):
+            if not engine.FILE_MASKS[x] & all_pawns:
+                open_files |= 1 << x
+        score = scores[engine.BLACK] - scores[engine.WHITE]
+        self.pawn_hash.store(board.pawn_key, score, open_files)
+        return score, open_files
+
     def evaluate_board_hard(self, state):
-        """Enhanced evaluation function for hard difficulty"""
-        black_score = 0
-        white_score = 0
-        
-        # Get number of pieces for endgame detection
-        num_pieces = sum(1 for p in state['black_pieces'] if p is not None) + sum(1 for p in state['white_pieces'] if p is not None)
-        is_endgame = num_pieces <= 12
-        
-        # Material value with positional bonuses
-        for i, piece in enumerate(state['black_pieces']):
-            if piece is not None:
-                x, y = state['black_locations'][i]
-                if x < 0 or y < 0:  # Skip captured pieces
-                    continue
-                    
-                black_score += self.piece_values[piece]
-                
-                # Add positional bonuses based on piece type
-                if piece == 'pawn':
-                    black_score += self.pawn_table[7-y][x]
-                    
-                    # Passed pawn detection (no enemy pawns in front)
-                    passed_pawn = True
-                    for j in range(y-1, -1, -1):  # Check squares in front of pawn
-                        if (x-1, j) in state['white_locations'] and state['white_pieces'][state['white_locations'].index((x-1, j))] == 'pawn':
-                            passed_pawn = False
-                            break
-                        if (x, j) in state['white_locations'] and state['white_pieces'][state['white_locations'].index((x, j))] == 'pawn':
-                            passed_pawn = False
-                            break
-                        if (x+1, j) in state['white_locations'] and state['white_pieces'][state['white_locations'].index((x+1, j))] == 'pawn':
-                            passed_pawn = False
-                            break
-                    
-                    if passed_pawn:
-                        black_score += (7-y) * 20  # Further advanced passed pawns worth more
-                    
-                    # Connected pawns bonus
-                    for dx in [-1, 1]:
-                        if (x+dx, y) in state['black_locations']:
-                            idx = state['black_locations'].index((x+dx, y))
-                            if state['black_pieces'][idx] == 'pawn':
-                                black_score += 15
-                                
-                elif piece == 'knight':
-                    black_score += self.knight_table[7-y][x]
-                    
-                elif piece == 'bishop':
-                    black_score += self.bishop_table[7-y][x]
-                    
-                    # Bishop pair bonus
-                    if sum(1 for p in state['black_pieces'] if p == 'bishop') >= 2:
-                        black_score += 50
-                        
-                elif piece == 'rook':
-                    black_score += self.rook_table[7-y][x]
-                    
-                    # Rook on open file bonus (no pawns on file)
-                    open_file = True
-                    for j in range(8):
-                        for locs, pcs in [(state['black_locations'], state['black_pieces']), (state['white_locations'], state['white_pieces'])]:
-                            if (x, j) in locs and pcs[locs.index((x, j))] == 'pawn':
-                                open_file = False
-                                break
-                    
-                    if open_file:
-                        black_score += 30
-                    
-                    # Rook on 7th rank is powerful in endgame
-                    if y == 1:  # 7th rank from black's perspective
-                        black_score += 40
-                        
-                elif piece == 'queen':
-                    black_score += self.queen_table[7-y][x]
-                    
-                elif piece == 'king':
-                    # Use different tables for middle game and endgame
-                    if is_endgame:
-                        black_score += self.king_endgame_table[7-y][x]
-                    else:
-                        black_score += self.king_middle_table[7-y][x]
-        
-        for i, piece in enumerate(state['white_pieces']):
-            if piece is not None:
-                x, y = state['white_locations'][i]
-                if x < 0 or y < 0:  # Skip captured pieces
-                    continue
-                    
-                white_score += self.piece_values[piece]
-                
-                # Add positional bonuses based on piece type
-                if piece == 'pawn':
-                    white_score += self.pawn_table[y][x]
-                    
-                    # Passed pawn detection
-                    passed_pawn = True
-                    for j in range(y+1, 8):  # Check squares in front of pawn
-                        if (x-1, j) in state['black_locations'] and state['black_pieces'][state['black_locations'].index((x-1, j))] == 'pawn':
-                            passed_pawn = False
-                            break
-                        if (x, j) in state['black_locations'] and state['black_pieces'][state['black_locations'].index((x, j))] == 'pawn':
-                            passed_pawn = False
-                            break
-                        if (x+1, j) in state['black_locations'] and state['black_pieces'][state['black_locations'].index((x+1, j))] == 'pawn':
-                            passed_pawn = False
-                            break
-                    
-                    if passed_pawn:
-                        white_score += y * 20  # Further advanced passed pawns worth more
-                    
-                    # Connected pawns bonus
-                    for dx in [-1, 1]:
-                        if (x+dx, y) in state['white_locations']:
-                            idx = state['white_locations'].index((x+dx, y))
-                            if state['white_pieces'][idx] == 'pawn':
-                                white_score += 15
-                                
-                elif piece == 'knight':
-                    white_score += self.knight_table[y][x]
-                    
-                elif piece == 'bishop':
-                    white_score += self.bishop_table[y][x]
-                    
-                    # Bishop pair bonus
-                    if sum(1 for p in state['white_pieces'] if p == 'bishop') >= 2:
-                        white_score += 50
-                        
-                elif piece == 'rook':
-                    white_score += self.rook_table[y][x]
-                    
-                    # Rook on open file bonus
-                    open_file = True
-                    for j in range(8):
-                        for locs, pcs in [(state['black_locations'], state['black_pieces']), (state['white_locations'], state['white_pieces'])]:
-                            if (x, j) in locs and pcs[locs.index((x, j))] == 'pawn':
-                                open_file = False
-                                break
-                    
-                    if open_file:
-                        white_score += 30
-                    
-                    # Rook on 2nd rank is powerful in endgame
-                    if y == 6:  # 2nd rank from white's perspective
-                        white_score += 40
-                        
-                elif piece == 'queen':
-                    white_score += self.queen_table[y][x]
-                    
-                elif piece == 'king':
-                    # Use different tables for middle game and endgame
-                    if is_endgame:
-                        white_score += self.king_endgame_table[y][x]
-                    else:
-                        white_score += self.king_middle_table[y][x]
-        
-        # Center control bonus (weighted higher)
-        inner_center = [(3, 3), (3, 4), (4, 3), (4, 4)]
-        outer_center = [(2, 2), (2, 3), (2, 4), (2, 5), (3, 2), (3, 5), (4, 2), (4, 5), (5, 2), (5, 3), (5, 4), (5, 5)]
-        
-        for loc in state['black_locations']:
-            if loc in inner_center:
-                black_score += 30
-            elif loc in outer_center:
-                black_score += 15
-                
-        for loc in state['white_locations']:
-            if loc in inner_center:
-                white_score += 30
-            elif loc in outer_center:
-                white_score += 15
-        
-        # Mobility bonus - actual move count
-        black_mobility = sum(len(moves) for moves in state['black_options'] if moves)
-        white_mobility = sum(len(moves) for moves in state['white_options'] if moves)
-        black_score += black_mobility * 3
-        white_score += white_mobility * 3
-        
-        # King tropism in endgame (pieces closer to enemy king get bonus)
-        if is_endgame:
-            try:
-                white_king_idx = state['white_pieces'].index('king')
-                white_king_pos = state['white_locations'][white_king_idx]
-                
-                for i, piece in enumerate(state['black_pieces']):
-                    if piece and piece != 'king' and piece != 'pawn':
-                        dist = abs(state['black_locations'][i][0] - white_king_pos[0]) + abs(state['black_locations'][i][1] - white_king_pos[1])
-                        black_score += (14 - dist) * 10  # Closer pieces get higher bonus
-            except ValueError:
-                pass
-                
-            try:
-                black_king_idx = state['black_pieces'].index('king')
-                black_king_pos = state['black_locations'][black_king_idx]
-                
-                for i, piece in enumerate(state['white_pieces']):
-                    if piece and piece != 'king' and piece != 'pawn':
-                        dist = abs(state['white_locations'][i][0] - black_king_pos[0]) + abs(state['white_locations'][i][1] - black_king_pos[1])
-                        white_score += (14 - dist) * 10
-            except ValueError:
-                pass
+        """Enhanced evaluation function for hard difficulty
+
+        Material and piece placement come from the board's running
+        piece-square sums and pawn structure from the pawn hash; only the
+        terms that depend on other pieces (bishop pair, rooks on open files,
+        king safety) are computed here.
+        """
+        board = self._board(state)
+        if board.psq_tables is self.psq_tables:
+            psq_mg, psq_eg = board.psq_mg, board.psq_eg
+        else:
+            psq_mg, psq_eg = board.piece_square_totals(self.psq_tables)
+        scores = [0, 0]
         
-        # King safety evaluation
-        if not is_endgame:
-            # Count attackers near kings
-            try:
-                black_king_idx = state['black_pieces'].index('king')
-                black_king_pos = state['black_locations'][black_king_idx]
-                
-                white_attackers = 0
-                for i, piece in enumerate(state['white_pieces']):
-                    if piece is None:
-                        continue
-                    pos = state['white_locations'][i]
-                    dist = max(abs(pos[0] - black_king_pos[0]), abs(pos[1] - black_king_pos[1]))
-                    if dist <= 2:
-                        white_attackers += 1
-                        
-                # Penalize for attackers near the king
-                black_score -= white_attackers * 40
-            except ValueError:
-                pass
-                
-            try:
-                white_king_idx = state['white_pieces'].index('king')
-                white_king_pos = state['white_locations'][white_king_idx]
-                
-                black_attackers = 0
-                for i, piece in enumerate(state['black_pieces']):
-                    if piece is None:
-                        continue
-                    pos = state['black_locations'][i]
-                    dist = max(abs(pos[0] - white_king_pos[0]), abs(pos[1] - white_king_pos[1]))
-                    if dist <= 2:
-                        black_attackers += 1
-                        
-                # Penalize for attackers near the king
-                white_score -= black_attackers * 40
-            except ValueError:
-                pass
+        is_endgame = self.is_endgame(board)
+        pawn_score, open_files = self._pawn_structure(board)
         
-        # Check and checkmate status
-        if state.get('check') == 'white':
-            black_score += 75  # Bonus for having opponent in check
-        elif state.get('check') == 'black':
-            white_score += 75
+        for c in (engine.WHITE, engine.BLACK):
+            own = board.pieces[c]
+            score = 0
             
-        if state.get('checkmate') and state.get('check') == 'white':
-            black_score += 10000  # Huge bonus for checkmate
-        elif state.get('checkmate') and state.get('check') == 'black':
-            white_score += 10000
+            # Bishop pair bonus, counted once per bishop
+            bishops = board.counts[engine.piece_code(c, engine.BISHOP)]
+            if bishops >= 2:
+                score += 50 * bishops
             
-        return black_score - white_score
+            # Rook on open file bonus (no pawns on file)
+            for sq in engine.iter_bits(own[engine.ROOK]):
+                if open_files >> (sq % 8) & 1:
+                    score += 30
+            
+            occupied = board.occupied[c]
+            if is_endgame:
+                # King tropism in endgame (pieces closer to enemy king get bonus)
+                enemy_king = board.king_square(c ^ 1)
+                if enemy_king is not None:
+                    kx, ky = enemy_king % 8, enemy_king // 8
+                    for sq in engine.iter_bits(occupied & ~own[engine.KING] & ~own[engine.PAWN]):
+                        dist = abs(sq % 8 - kx) + abs(sq // 8 - ky)
+                        score += (14 - dist) * 10  # Closer pieces get higher bonus
+            else:
+                # King safety: penalize enemy pieces near our king
+                king = board.king_square(c)
+                if king is not None:
+                    score -= 40 * engine.popcount(engine.KING_ZONES[king] & board.occupied[c ^ 1])
+            
+            scores[c] = score
+        
+        # Use different king tables for middle game and endgame
+        psq = psq_eg if is_endgame else psq_mg
+        return psq + pawn_score + scores[engine.BLACK] - scores[engine.WHITE]
 
     def evaluate_board_grandmaster(self, state):
         # Enhanced evaluation for grandmaster play: use the hard evaluation plus extra bonus
@@ -407,7 +600,8 @@ class ChessAI:
         king_safety_bonus = 50  # Additional bonus for precise king safety evaluation
         return base_eval + king_safety_bonus
         
-    def get_move(self, state):
+    def get_move(self, state, deadline=None):
+        self.deadline = deadline or Deadline()
         valid_moves = self._get_all_valid_moves(state)
         if not valid_moves:
             return None
@@ -430,15 +624,17 @@ class ChessAI:
             if piece_moves:
                 current_pos = state['black_locations'][i]
                 for move in piece_moves:
-                    move_coords = move if isinstance(move, tuple) else move[:2]
+                    move_coords = tuple(move[:2])
                     moves.append((i, move_coords, current_pos))
         return moves
     
     def _get_easy_move(self, state, valid_moves):
         capture_moves = []
         normal_moves = []
+        board = self._board(state)
         for piece_idx, move, from_pos in valid_moves:
-            if move in state['white_locations']:
+            target = board.piece_at(*move)
+            if target is not None and target[0] == 'white':
                 capture_moves.append((piece_idx, move, from_pos))
             else:
                 normal_moves.append((piece_idx, move, from_pos))
@@ -449,10 +645,12 @@ class ChessAI:
     def _get_best_move(self, state, valid_moves):
         best_score = float('-inf')
         best_move = None
+        board = self._board(state)
         for piece_idx, move, from_pos in valid_moves:
             sim_state = copy.deepcopy(state)
-            if move in state['white_locations']:
-                captured_idx = state['white_locations'].index(move)
+            target = board.piece_at(*move)
+            if target is not None and target[0] == 'white':
+                captured_idx = board.index_at(*move)
                 sim_state['white_pieces'][captured_idx] = None
                 sim_state['white_locations'][captured_idx] = (-1, -1)
             sim_state['black_locations'][piece_idx] = move
@@ -466,16 +664,18 @@ class ChessAI:
         # Similar to _get_best_move but with a reduced randomness factor 
         best_score = float('-inf')
         best_move = None
+        board = self._board(state)
         for piece_idx, move, from_pos in valid_moves:
             sim_state = copy.deepcopy(state)
             # Apply move simulation
-            if move in state['white_locations']:
-                captured_idx = state['white_locations'].index(move)
+            target = board.piece_at(*move)
+            if target is not None and target[0] == 'white':
+                captured_idx = board.index_at(*move)
                 sim_state['white_pieces'][captured_idx] = None
                 sim_state['white_locations'][captured_idx] = (-1, -1)
             sim_state['black_locations'][piece_idx] = move
             # Penalize if move leaves king exposed (if king is in check after move, large penalty)
-            penalty = -100 if is_check('black', sim_state.get('white_locations'), sim_state.get('black_locations')) else 0
+            penalty = -100 if is_check('black', sim_state) else 0
             score = self.evaluate_board(sim_state) + random.uniform(-5, 5) + penalty
             if score > best_score:
                 best_score = score
@@ -484,412 +684,774 @@ class ChessAI:
 
     def _get_all_valid_moves_color(self, state, color):
         moves = []
-        if color == 'black':
-            for i, piece in enumerate(state['black_pieces']):
-                if piece is None:
-                    continue
-                moves_list = state['black_options'][i]
-                if moves_list:
-                    current_pos = state['black_locations'][i]
-                    for move in moves_list:
-                        move_coords = move if isinstance(move, tuple) else move[:2]
-                        moves.append((i, move_coords, current_pos))
-        else:
-            for i, piece in enumerate(state['white_pieces']):
-                if piece is None:
-                    continue
-                moves_list = state['white_options'][i]
-                if moves_list:
-                    current_pos = state['white_locations'][i]
-                    for move in moves_list:
-                        move_coords = move if isinstance(move, tuple) else move[:2]
-                        moves.append((i, move_coords, current_pos))
+        for i, piece in enumerate(state[color + '_pieces']):
+            if piece is None:
+                continue
+            moves_list = state[color + '_options'][i]
+            if moves_list:
+                current_pos = state[color + '_locations'][i]
+                for move in moves_list:
+                    moves.append((i, tuple(move[:2]), current_pos))
         return moves
 
-    def state_hash(self, state):
-        """Create a hashable representation of the board state."""
-        # We only care about pieces and their positions for the hash
-        white_pieces = tuple(state['white_pieces'])
-        black_pieces = tuple(state['black_pieces'])
-        white_locs = tuple(tuple(loc) for loc in state['white_locations'])
-        black_locs = tuple(tuple(loc) for loc in state['black_locations'])
+    def _board(self, state):
+        """Mailbox/bitboard view of a state; the search passes a Position directly."""
+        if isinstance(state, engine.Position):
+            return state
+        board = engine.Position.from_state(state)
+        self._attach_tables(board)
+        return board
+
+    def _attach_tables(self, board):
+        """Have make_move keep this AI's piece-square sums on ``board``.
+
+        Only safe before the search plays its first move: undo records made
+        earlier would restore sums from before the tables were attached.
+        """
+        if board.psq_tables is not self.psq_tables:
+            board.set_piece_square_tables(self.psq_tables)
+
+    def _root_moves(self, state):
+        """Board for the search and black's options as {encoded move: app move}."""
+        board = engine.Position.from_state(state)
+        board.set_side(engine.BLACK)
+        root_moves = {}
+        for piece_idx, move, from_pos in self._get_all_valid_moves_color(state, 'black'):
+            code = board.move_code(engine.square(*from_pos), engine.square(*move))
+            root_moves[code] = (piece_idx, move, from_pos)
+        return board, root_moves
+
+    def search_moves(self, board, c, captures=False):
+        """Moves the search expands for side ``c``, generated from the board at this node."""
+        if captures:
+            return board.generate_captures(c)
+        moves = board.generate_moves(c)
+        if board.castling:
+            moves.extend(board.castle_moves(c))
+        return moves
+
+    def _count_node(self):
+        """Count a search node and stop the search once its deadline has passed."""
+        self.nodes += 1
+        if not self.nodes & (self.deadline_check_interval - 1) and self.search_deadline.expired():
+            raise SearchCancelled()
+
+    def minimax(self, board, depth, alpha, beta, maximizing):
+        """Score ``board`` from black's point of view (black maximizes), ``depth`` plies deep."""
+        self._attach_tables(board)
+        if maximizing:
+            return self.negamax(board, depth, alpha, beta, 0, [])
+        return -self.negamax(board, depth, -beta, -alpha, 0, [])
+
+    def _evaluate_relative(self, board):
+        """evaluate_board_hard from the side to move's point of view, as negamax needs it."""
+        # The evaluation ignores whose turn it is, so both sides share an entry
+        key = board.key ^ engine.ZOBRIST_SIDE if board.side == engine.BLACK else board.key
+        score = self.eval_cache.probe(key)
+        if score is None:
+            score = self.evaluate_board_hard(board)
+            self.eval_cache.store(key, score)
+        return score if board.side == engine.BLACK else -score
+
+    def is_endgame(self, state):
+        board = self._board(state)
+        return board.piece_count <= ENDGAME_PIECES
+
+    def negamax(self, board, depth, alpha, beta, ply, pv, on_pv=False, allow_null=True):
+        """Principal variation search, scored for the side to move.
+
+        The first move at each node is searched with the full window and the
+        rest with a null window, re-searched only if they beat alpha. ``pv``
+        is filled with the best line found; ``on_pv`` marks nodes along the
+        previous iteration's PV, whose move is then tried first.
+
+        Off the PV, a null move (passing the turn) that still fails high prunes
+        the node, and quiet moves ordered late are searched shallower first.
+        ``allow_null`` is False right after a null move so two never follow.
+        """
+        self._count_node()
         
-        # Combine into a hashable representation
-        key = (white_pieces, black_pieces, white_locs, black_locs)
+        # A position repeated along the current line is a draw
+        if board.is_repetition():
+            return 0
         
-        # Create a hash using hashlib for efficiency
-        hash_str = str(hash(key))
-        return hash_str
-    
-    def minimax(self, state, depth, alpha, beta, maximizing, quiescence=False):
-        # Look up position in transposition table
-        state_key = self.state_hash(state)
-        tt_entry = self.tt.get((state_key, depth, maximizing))
+        # Use quiescence search to handle horizon effect
+        if depth <= 0:
+            return self.quiescence_search(board, alpha, beta, 0, ply)
+        
+        # Look up position in transposition table; a shallower entry still
+        # supplies its best move for ordering. Bounds only cut off and never
+        # narrow the window, so the store below classifies the result
+        # against the window actually searched
+        alpha_orig = alpha
+        hash_move = None
+        tt_entry = self.tt.probe(board.key)
         if tt_entry is not None:
-            return tt_entry
+            tt_depth, tt_score, bound, hash_move = tt_entry
+            tt_score = self._score_from_tt(tt_score, ply)
+            if tt_depth >= depth and (bound == EXACT or (bound == LOWER and tt_score >= beta) or
+                                      (bound == UPPER and tt_score <= alpha)):
+                return tt_score
         
-        # Base case—if depth is 0 or game is over
-        if depth == 0 or state.get('game_over'):
-            if depth == 0 and not state.get('game_over') and not quiescence:
-                # Use quiescence search to handle horizon effect
-                eval_score = self.quiescence_search(state, alpha, beta, maximizing, 0)
-            else:
-                eval_score = self.evaluate_board_hard(state) if self.difficulty == 'hard' else self.evaluate_board(state)
-            
-            # Store result in transposition table
-            self.tt[(state_key, depth, maximizing)] = eval_score
-            
-            # Manage transposition table size
-            if len(self.tt) > self.tt_max_size:
-                # Remove 10% of entries when we hit the limit
-                keys = list(self.tt.keys())
-                for i in range(int(self.tt_max_size * 0.1)):
-                    del self.tt[keys[i]]
+        c = board.side
+        color = engine.COLORS[c]
+        in_check = board.in_check(c)
+        
+        # Null move: if passing still beats beta, a real move would too. Not
+        # when in check, and not in endgames or without pieces beside pawns,
+        # where zugzwang makes passing better than every move
+        if (self.null_move_pruning and allow_null and not in_check and depth >= 3 and
+                beta - alpha == 1 and beta < MATE_SCORE - MAX_PLY and not self.is_endgame(board) and
+                board.occupied[c] & ~(board.pieces[c][engine.PAWN] | board.pieces[c][engine.KING])):
+            reduction = 3 if depth >= 6 else 2
+            key = board.make_null_move()
+            score = -self.negamax(board, depth - 1 - reduction, -beta, -beta + 1, ply + 1, [],
+                                  allow_null=False)
+            board.unmake_null_move(key)
+            if score >= beta:
+                self.null_move_cutoffs += 1
+                return beta
+        
+        # Frontier nodes off the PV whose static eval sits far below alpha
+        futility_score = None
+        if (depth <= 2 and not in_check and beta - alpha == 1 and
+                -MATE_SCORE + MAX_PLY < alpha < MATE_SCORE - MAX_PLY):
+            static_eval = self._evaluate_relative(board)
+            # Razoring: if even the captures cannot lift the score to alpha,
+            # the quiet moves are unlikely to
+            if self.razoring and static_eval + self.razor_margins[depth] <= alpha:
+                score = self.quiescence_search(board, alpha, beta, 0, ply)
+                if score <= alpha:
+                    self.razor_cutoffs += 1
+                    return score
+            # Futility: quiet moves that give no check cannot gain the margin
+            if self.futility_pruning and static_eval + self.futility_margins[depth] <= alpha:
+                futility_score = static_eval + self.futility_margins[depth]
+        
+        pv_move = self.pv[ply] if on_pv and ply < len(self.pv) else None
+        moves = self.staged_moves(board, c, hash_move, pv_move, ply)
+        killers = self.killers[ply] if ply < MAX_PLY else ()
+        best_score = -INFINITY
+        best_move = None
+        legal_moves = 0
+        
+        for move in moves:
+            quiet = not move & (engine.MOVE_CAPTURE | engine.MOVE_PROMOTION)
+            undo = board.make_move(move)
             
-            return eval_score
+            # Check if the move leaves the king in immediate danger
+            if self.is_king_vulnerable(board, color):
+                board.unmake_move(undo)
+                continue  # Skip this move if it's a blunder
             
-        # For maximizing player (black)
-        if maximizing:
-            max_eval = float('-inf')
-            moves = self._get_all_valid_moves_color(state, 'black')
-            moves = self.order_moves(state, moves, 'black')
-            
-            for piece_idx, move, from_pos in moves:
-                sim_state = self.fast_simulate_move(state, piece_idx, move, 'black')
-                
-                # Check if the move leaves the king in immediate danger
-                if self.is_king_vulnerable(sim_state, 'black'):
-                    continue  # Skip this move if it's a blunder
-                
-                eval_score = self.minimax(sim_state, depth - 1, alpha, beta, False)
-                max_eval = max(max_eval, eval_score)
-                alpha = max(alpha, eval_score)
-                if beta <= alpha:
-                    break
+            legal_moves += 1
+            if (futility_score is not None and legal_moves > 1 and quiet and
+                    not board.in_check(c ^ 1)):
+                board.unmake_move(undo)
+                self.futility_pruned += 1
+                # The skipped move is assumed to score no better than this
+                best_score = max(best_score, futility_score)
+                continue
+            child_pv = []
+            if legal_moves == 1:
+                score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1, child_pv,
+                                      on_pv and move == pv_move)
+            else:
+                # Late quiet moves rarely matter: search them shallower and only
+                # at full depth if they beat alpha anyway
+                reduction = 0
+                if (self.late_move_reductions and quiet and legal_moves > 3 and depth >= 3 and
+                        not in_check and move not in killers and not board.in_check(c ^ 1)):
+                    reduction = 2 if legal_moves > 10 and depth >= 5 else 1
+                    self.reductions += 1
+                score = -self.negamax(board, depth - 1 - reduction, -alpha - 1, -alpha, ply + 1, child_pv)
+                if reduction and score > alpha:
+                    self.reduction_researches += 1
+                    score = -self.negamax(board, depth - 1, -alpha - 1, -alpha, ply + 1, child_pv)
+                if alpha < score < beta:
+                    score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1, child_pv)
+            board.unmake_move(undo)
             
-            # Store result in transposition table
-            self.tt[(state_key, depth, maximizing)] = max_eval
-            return max_eval
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    pv[:] = [move] + child_pv
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        if legal_moves == 1:
+                            self.first_move_cutoffs += 1
+                        if quiet:
+                            self._record_quiet_cutoff(move, c, ply, depth)
+                        break
         
-        # For minimizing player (white)
+        # No move keeps the king safe: lost, and sooner is worse
+        if not legal_moves:
+            best_score = -MATE_SCORE + ply
+        
+        # Store result in transposition table with the bound it proves
+        self.tt.store(board.key, depth, self._score_to_tt(best_score, ply),
+                      self._bound(best_score, alpha_orig, beta), best_move)
+        return best_score
+
+    def _record_quiet_cutoff(self, move, c, ply, depth):
+        """Remember a quiet move that refuted this node, for ordering its siblings."""
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        history = self.history[c]
+        index = move & engine.MOVE_SQUARES
+        history[index] += depth * depth
+        if history[index] > HISTORY_MAX:
+            # Halve the side's table so old cutoffs fade and scores stay below the killers
+            for i, value in enumerate(history):
+                history[i] = value >> 1
+
+    def _new_search(self, board=None):
+        """Reset the per-search tables before a move is chosen from ``board``."""
+        # Keep the table from earlier turns of this game; its entries are
+        # aged so this search's results take priority
+        self.tt.new_search()
+        # The rest of the last PV still applies when the game followed it
+        # through our move and the reply it predicted
+        if board is not None and self.pv_key is not None and board.key == self.pv_key:
+            self.pv = self.pv[2:]
         else:
-            min_eval = float('inf')
-            moves = self._get_all_valid_moves_color(state, 'white')
-            moves = self.order_moves(state, moves, 'white')
-            
-            for piece_idx, move, from_pos in moves:
-                sim_state = self.fast_simulate_move(state, piece_idx, move, 'white')
-                
-                # Check if the move leaves the king in immediate danger
-                if self.is_king_vulnerable(sim_state, 'white'):
-                    continue  # Skip this move if it's a blunder
-                    
-                eval_score = self.minimax(sim_state, depth - 1, alpha, beta, True)
-                min_eval = min(min_eval, eval_score)
-                beta = min(beta, eval_score)
-                if beta <= alpha:
-                    break
-            
-            # Store result in transposition table
-            self.tt[(state_key, depth, maximizing)] = min_eval
-            return min_eval
+            self.pv = []
+        self.pv_key = None
+        # Killers belong to the plies of the last search; history only fades
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        for history in self.history:
+            for i, value in enumerate(history):
+                history[i] = value >> 1
+
+    def _expect_reply(self, state, move):
+        """Remember the position the PV predicts after ``move`` from ``state`` and the reply to it."""
+        self.pv_key = None
+        if len(self.pv) > 2 and self.pv[0] == move:
+            board = engine.Position.from_state(state)
+            board.set_side(engine.BLACK)
+            for move in self.pv[:2]:
+                board.make_move(move)
+            self.pv_key = board.key
+
+    @staticmethod
+    def _score_to_tt(score, ply):
+        """A score as stored in the table: mates counted from this node, not the root.
+
+        The table outlives the search and is probed at other plies, so a
+        mate found ``n`` plies below one node must read as ``n`` plies
+        below whichever node finds the entry.
+        """
+        if score >= MATE_SCORE - MAX_PLY:
+            return score + ply
+        if score <= -MATE_SCORE + MAX_PLY:
+            return score - ply
+        return score
+
+    @staticmethod
+    def _score_from_tt(score, ply):
+        """A stored score made root-relative again for a node ``ply`` plies from the root."""
+        if score >= MATE_SCORE - MAX_PLY:
+            return score - ply
+        if score <= -MATE_SCORE + MAX_PLY:
+            return score + ply
+        return score
+
+    @staticmethod
+    def _bound(score, alpha, beta):
+        """Bound type of a score searched with the window (alpha, beta)."""
+        if score <= alpha:
+            return UPPER
+        if score >= beta:
+            return LOWER
+        return EXACT
 
     def is_king_vulnerable(self, state, color):
         """Check if the king is vulnerable after a move"""
-        if color == 'black':
-            king_idx = next((i for i, p in enumerate(state['black_pieces']) if p == 'king'), None)
-            if king_idx is None:
-                return False  # King is already captured
-            king_pos = state['black_locations'][king_idx]
-            return self.is_square_attacked(state, king_pos, 'white')  # Check if white attacks the square
-        else:
-            king_idx = next((i for i, p in enumerate(state['white_pieces']) if p == 'king'), None)
-            if king_idx is None:
-                return False  # King is already captured
-            king_pos = state['white_locations'][king_idx]
-            return self.is_square_attacked(state, king_pos, 'black')  # Check if black attacks the square
+        return self._board(state).in_check(engine.color_index(color))
 
     def is_square_attacked(self, state, square, attacking_color):
         """Check if a square is attacked by the specified color"""
-        if attacking_color == 'white':
-            pieces = state['white_pieces']
-            locations = state['white_locations']
-        else:
-            pieces = state['black_pieces']
-            locations = state['black_locations']
+        board = self._board(state)
+        return board.is_square_attacked(engine.square(*square), engine.color_index(attacking_color))
 
-        for i, piece in enumerate(pieces):
-            if piece is None:
-                continue
-            pos = locations[i]
-            if piece == 'pawn':
-                moves = self.check_pawn(pos, attacking_color, state['white_locations'], state['black_locations'])
-            elif piece == 'rook':
-                moves = self.check_rook(pos, attacking_color, state['white_locations'], state['black_locations'])
-            elif piece == 'knight':
-                moves = self.check_knight(pos, attacking_color, state['white_locations'], state['black_locations'])
-            elif piece == 'bishop':
-                moves = self.check_bishop(pos, attacking_color, state['white_locations'], state['black_locations'])
-            elif piece == 'queen':
-                moves = self.check_queen(pos, attacking_color, state['white_locations'], state['black_locations'])
-            elif piece == 'king':
-                moves = self.check_king_moves(pos, attacking_color, i, state['white_locations'], state['black_locations'])
-            if square in moves:
-                return True
-        return False
-
-    def check_pawn(self, position, color, cur_white_locations=None, cur_black_locations=None):
-        # Get locations from session state if not provided
-        white_locs = cur_white_locations
-        black_locs = cur_black_locations
-        
-        moves_list = []
-        x, y = position
-        if color == 'white':
-            if (x + 1, y + 1) in black_locs:
-                moves_list.append((x + 1, y + 1))
-            if (x - 1, y + 1) in black_locs:
-                moves_list.append((x - 1, y + 1))
-        else:
-            if (x + 1, y - 1) in white_locs:
-                moves_list.append((x + 1, y - 1))
-            if (x - 1, y - 1) in white_locs:
-                moves_list.append((x - 1, y - 1))
-        return moves_list
-
-    def check_rook(self, position, color, cur_white_locations=None, cur_black_locations=None):
-        white_locs = cur_white_locations
-        black_locs = cur_black_locations
-        
-        moves_list = []
-        x, y = position
-        for dx, dy in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
-            nx, ny = x + dx, y + dy
-            while 0 <= nx <= 7 and 0 <= ny <= 7:
-                current_pos = (nx, ny)
-                if current_pos in white_locs:
-                    if color=='black':
-                        moves_list.append(current_pos)
-                    break
-                elif current_pos in black_locs:
-                    if color=='white':
-                        moves_list.append(current_pos)
-                    break
-                else:
-                    moves_list.append(current_pos)
-                nx += dx
-                ny += dy
-        return moves_list
-
-    def check_knight(self, position, color, cur_white_locations=None, cur_black_locations=None):
-        white_locs = cur_white_locations
-        black_locs = cur_black_locations
-        
-        moves_list = []
-        x, y = position
-        targets = [(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)]
-        for dx, dy in targets:
-            nx, ny = x + dx, y + dy
-            if 0 <= nx <= 7 and 0 <= ny <= 7:
-                # Knight can jump over pieces; only disallow if target is a friendly piece.
-                if color == 'white':
-                    if (nx, ny) not in white_locs:
-                        moves_list.append((nx, ny))
-                else:
-                    if (nx, ny) not in black_locs:
-                        moves_list.append((nx, ny))
-        return moves_list
-
-    def check_bishop(self, position, color, cur_white_locations=None, cur_black_locations=None):
-        white_locs = cur_white_locations
-        black_locs = cur_black_locations
-        
-        moves_list = []
-        x,y = position
-        for dx, dy in [(1,1),(1,-1),(-1,1),(-1,-1)]:
-            nx, ny = x+dx, y+dy
-            while 0<=nx<=7 and 0<=ny<=7:
-                current_pos = (nx, ny)
-                if current_pos in white_locs:
-                    if color=='black':
-                        moves_list.append(current_pos)
-                    break
-                elif current_pos in black_locs:
-                    if color=='white':
-                        moves_list.append(current_pos)
-                    break
-                else:
-                    moves_list.append(current_pos)
-                nx += dx
-                ny += dy
-        return moves_list
-
-    def check_queen(self, position, color, cur_white_locations=None, cur_black_locations=None):
-        moves_list = []
-        moves_list.extend(self.check_rook(position, color, cur_white_locations, cur_black_locations))
-        moves_list.extend(self.check_bishop(position, color, cur_white_locations, cur_black_locations))
-        return moves_list
-
-    def check_king_moves(self, position, color, index, cur_white_locations=None, cur_black_locations=None):
-        white_locs = cur_white_locations
-        black_locs = cur_black_locations
-        
-        moves_list = []
-        if color == 'white':
-            friends_list = white_locs
-        else:
-            friends_list = black_locs
-        targets = [(1, 0), (1, 1), (1, -1), (-1, 0), (-1, 1), (-1, -1), (0, 1), (0, -1)]
-        for t in targets:
-            target = (position[0] + t[0], position[1] + t[1])
-            if 0 <= target[0] <= 7 and 0 <= target[1] <= 7 and target not in friends_list:
-                moves_list.append(target)
-        return moves_list
-    
-    def fast_simulate_move(self, state, piece_idx, move, color):
-        """Efficiently simulate a move with minimal copying"""
-        # Create a new state by selectively copying only the necessary components
-        sim_state = {
-            'white_pieces': state['white_pieces'].copy(),
-            'black_pieces': state['black_pieces'].copy(),
-            'white_locations': [tuple(loc) for loc in state['white_locations']],
-            'black_locations': [tuple(loc) for loc in state['black_locations']],
-            'turn_step': state['turn_step'] + 1,
-            'white_options': state.get('white_options', []),
-            'black_options': state.get('black_options', [])
-        }
-        
-        # Apply the move
-        if color == 'black':
-            # Check for capture
-            if move in state['white_locations']:
-                captured_idx = state['white_locations'].index(move)
-                sim_state['white_pieces'][captured_idx] = None
-                sim_state['white_locations'][captured_idx] = (-1, -1)
-            sim_state['black_locations'][piece_idx] = move
-        else:  # white
-            # Check for capture
-            if move in state['black_locations']:
-                captured_idx = state['black_locations'].index(move)
-                sim_state['black_pieces'][captured_idx] = None
-                sim_state['black_locations'][captured_idx] = (-1, -1)
-            sim_state['white_locations'][piece_idx] = move
-        
-        return sim_state
-    
-    def quiescence_search(self, state, alpha, beta, maximizing, depth):
-        """Extend search for captures to avoid horizon effect"""
+    def quiescence_search(self, board, alpha, beta, depth, ply=0):
+        """Extend search for captures to avoid horizon effect (negamax, side to move's view)
+
+        ``ply`` is this node's distance from the root, for mate scores in the table.
+        """
+        self._count_node()
         if depth > 5:  # Limit quiescence depth
-            return self.evaluate_board_hard(state)
+            return self._evaluate_relative(board)
         
-        # Use state hash for transposition table lookup
-        state_key = self.state_hash(state)
-        tt_entry = self.tt.get((state_key, -depth, maximizing))  # Use negative depth to distinguish from regular search
+        # Capture-only results are stored at depth -depth, below every full-width
+        # entry; one is reusable wherever at least as many capture plies remained
+        alpha_orig = alpha
+        tt_entry = self.tt.probe(board.key)
         if tt_entry is not None:
-            return tt_entry
-            
-        stand_pat = self.evaluate_board_hard(state)
-        
-        if maximizing:
-            if stand_pat >= beta:
-                return beta
-            if alpha < stand_pat:
-                alpha = stand_pat
-                
-            moves = self._get_all_valid_moves_color(state, 'black')
-            # Only consider captures for quiescence search
-            capture_moves = [m for m in moves if m[1] in state['white_locations']]
+            tt_depth, tt_score, bound, _ = tt_entry
+            tt_score = self._score_from_tt(tt_score, ply)
+            if tt_depth >= -depth and (bound == EXACT or (bound == LOWER and tt_score >= beta) or
+                                       (bound == UPPER and tt_score <= alpha)):
+                return tt_score
             
-            for piece_idx, move, from_pos in capture_moves:
-                sim_state = self.fast_simulate_move(state, piece_idx, move, 'black')
-                eval_score = self.quiescence_search(sim_state, alpha, beta, False, depth + 1)
-                alpha = max(alpha, eval_score)
-                if beta <= alpha:
-                    break
+        stand_pat = self._evaluate_relative(board)
+        if stand_pat >= beta:
+            return beta
+        if alpha < stand_pat:
+            alpha = stand_pat
             
-            # Store result in transposition table
-            self.tt[(state_key, -depth, maximizing)] = alpha
-            return alpha
-        else:
-            if stand_pat <= alpha:
-                return alpha
-            if beta > stand_pat:
-                beta = stand_pat
-                
-            moves = self._get_all_valid_moves_color(state, 'white')
-            # Only consider captures for quiescence search
-            capture_moves = [m for m in moves if m[1] in state['black_locations']]
+        # Only consider captures for quiescence search, best exchange first;
+        # one that loses material in the exchange cannot raise alpha
+        captures = []
+        for move in self.search_moves(board, board.side, captures=True):
+            exchange = self.see(board, move)
+            if exchange < 0:
+                self.see_pruned += 1
+            else:
+                captures.append((exchange, move))
+        captures.sort(reverse=True)
+        for _, move in captures:
+            # Delta pruning: even winning the victim outright, plus a margin,
+            # would leave this line below alpha
+            if self.delta_pruning:
+                gain = self.type_values[(board.squares[move & 63] & 7) - 1]
+                if move & engine.MOVE_PROMOTION:
+                    gain += self.type_values[engine.QUEEN] - self.type_values[engine.PAWN]
+                if stand_pat + gain + self.delta_margin <= alpha:
+                    self.delta_pruned += 1
+                    continue
+            undo = board.make_move(move)
+            score = -self.quiescence_search(board, -beta, -alpha, depth + 1, ply + 1)
+            board.unmake_move(undo)
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+        
+        # Store result in transposition table
+        self.tt.store(board.key, -depth, self._score_to_tt(alpha, ply), self._bound(alpha, alpha_orig, beta))
+        return alpha
             
-            for piece_idx, move, from_pos in capture_moves:
-                sim_state = self.fast_simulate_move(state, piece_idx, move, 'white')
-                eval_score = self.quiescence_search(sim_state, alpha, beta, True, depth + 1)
-                beta = min(beta, eval_score)
-                if beta <= alpha:
+
+    def see(self, board, move):
+        """Static exchange evaluation: material the mover nets if both sides keep
+        recapturing on the target square with their least valuable attacker.
+
+        Each side may stop capturing when that is better for it. Removing the
+        capturers from the occupancy uncovers sliders behind them (x-rays).
+        """
+        from_sq = move >> 6 & 63
+        to_sq = move & 63
+        squares = board.squares
+        values = self.type_values
+        pieces = board.pieces
+        victim = squares[to_sq]
+        gain = [values[(victim & 7) - 1] if victim else 0]
+        piece = (squares[from_sq] & 7) - 1
+        side = squares[from_sq] >> 3
+        if move & engine.MOVE_PROMOTION:
+            gain[0] += values[engine.QUEEN] - values[engine.PAWN]
+            piece = engine.QUEEN
+        on_square = values[piece]
+        occupied = (board.occupied[engine.WHITE] | board.occupied[engine.BLACK]) ^ (1 << from_sq)
+        side ^= 1
+        while True:
+            attackers = board.attackers_to(to_sq, side, occupied) & occupied
+            if not attackers:
+                break
+            # What this capture wins, assuming the other side recaptures
+            gain.append(on_square - gain[-1])
+            for piece in range(6):
+                attacker = attackers & pieces[side][piece]
+                if attacker:
                     break
-            
-            # Store result in transposition table
-            self.tt[(state_key, -depth, maximizing)] = beta
-            return beta
-            
-    def order_moves(self, state, moves, color):
-        """Order moves to improve alpha-beta pruning efficiency"""
+            occupied ^= attacker & -attacker
+            on_square = values[piece]
+            side ^= 1
+        # Back up the sequence: each side only captures when it gains
+        for i in range(len(gain) - 1, 0, -1):
+            gain[i - 1] = -max(-gain[i - 1], gain[i])
+        return gain[0]
+
+    def _capture_score(self, board, move):
+        """Ordering score of a capture, shared by order_moves and staged_moves.
+
+        King captures come first. Captures that win or trade material come
+        before the killers, best exchange first and then the cheaper
+        aggressor; losing ones score below zero, after the quiet moves.
+        """
+        squares = board.squares
+        if squares[move & 63] & 7 == engine.KING + 1:
+            return 20000
+        exchange = self.see(board, move)
+        if exchange >= 0:
+            return 1000 + exchange - self.type_values[(squares[move >> 6 & 63] & 7) - 1] / 100
+        return exchange
+
+    def order_moves(self, board, moves, c, hash_move=None, pv_move=None, ply=None):
+        """Order side ``c``'s encoded moves to improve alpha-beta pruning efficiency"""
         move_scores = []
+        squares = board.squares
+        history = self.history[c]
+        killers = self.killers[ply] if ply is not None and ply < MAX_PLY else (0, 0)
         
-        for piece_idx, move, from_pos in moves:
-            score = 0
+        for move in moves:
+            to_sq = move & 63
+            
+            # Generated moves never land on our own pieces
+            if squares[to_sq]:
+                score = self._capture_score(board, move)
             
-            # Higher priority for capturing kings (this was missing!)
-            if color == 'black':
-                if move in state['white_locations']:
-                    captured_idx = state['white_locations'].index(move)
-                    victim = state['white_pieces'][captured_idx]
-                    aggressor = state['black_pieces'][piece_idx]
-                    
-                    # Prioritize king captures with extremely high value
-                    if victim == 'king':
-                        score = 20000
-                    elif victim and aggressor:
-                        score = 10 * self.piece_values.get(victim, 0) - self.piece_values.get(aggressor, 0) / 100
+            # Quiet moves: this ply's killers first, then by history
+            elif move == killers[0]:
+                score = 500
+            elif move == killers[1]:
+                score = 450
             else:
-                if move in state['black_locations']:
-                    captured_idx = state['black_locations'].index(move)
-                    victim = state['black_pieces'][captured_idx]
-                    aggressor = state['white_pieces'][piece_idx]
-                    
-                    # Prioritize king captures with extremely high value
-                    if victim == 'king':
-                        score = 20000
-                    elif victim and aggressor:
-                        score = 10 * self.piece_values.get(victim, 0) - self.piece_values.get(aggressor, 0) / 100
+                score = history[move & engine.MOVE_SQUARES]
             
             # Prefer center moves
-            center_dist = abs(move[0] - 3.5) + abs(move[1] - 3.5)
-            score -= center_dist
+            x, y = to_sq % 8, to_sq // 8
+            score -= abs(x - 3.5) + abs(y - 3.5)
             
             # Prefer pawn promotions
-            if (color == 'black' and state['black_pieces'][piece_idx] == 'pawn' and move[1] == 0) or \
-               (color == 'white' and state['white_pieces'][piece_idx] == 'pawn' and move[1] == 7):
+            if move & engine.MOVE_PROMOTION:
                 score += 900  # Value close to a queen
+            
+            # The transposition table's best move from an earlier search goes first
+            if move == hash_move:
+                score += 100000
+            
+            # The previous iteration's principal variation goes before that
+            if move == pv_move:
+                score += 200000
                 
-            move_scores.append((score, (piece_idx, move, from_pos)))
+            move_scores.append((score, move))
             
         # Sort by score, highest first
         move_scores.sort(reverse=True)
         return [m for _, m in move_scores]
 
-    def _get_hard_move(self, state):
-        # Reset transposition table before each move calculation to avoid stale data
-        self.tt = {}
+    def staged_moves(self, board, c, hash_move=None, pv_move=None, ply=None):
+        """Yield side ``c``'s pseudo-legal moves best first, generating each stage only when reached.
+
+        The stages are: the PV move and the hash move, tried before anything
+        is generated; captures and promotions that do not lose material,
+        best first; this ply's killers; quiet moves by history; then the
+        losing captures. Within a stage moves rank as order_moves ranks
+        them. A node that cuts off early never generates or scores the
+        stages after it.
+        """
+        squares = board.squares
+        tactical = engine.MOVE_CAPTURE | engine.MOVE_PROMOTION
+        tried = []
+        for move in (pv_move, hash_move):
+            if move and move not in tried and board.is_pseudo_legal(c, move):
+                tried.append(move)
+                yield move
         
-        best_move = None
-        best_score = float('-inf')
+        # Captures and pushes onto the last rank; other pieces' moves to the
+        # last rank come along and wait for the quiet stage
+        winning, losing = [], []
+        empty = ~board.all_occupied & engine.FULL_BOARD
+        promotion_rank = engine.RANK_MASKS[7 if c == engine.WHITE else 0]
+        for move in board.generate_moves(c, board.occupied[c ^ 1] | (promotion_rank & empty)):
+            if not move & tactical or move in tried:
+                continue
+            score = self._capture_score(board, move) if squares[move & 63] else 0
+            if move & engine.MOVE_PROMOTION:
+                score += 900  # Value close to a queen
+            (winning if score >= 0 else losing).append((score, move))
+        winning.sort(reverse=True)
+        for _, move in winning:
+            yield move
+        
+        # Killers are quiet where they were recorded, and is_pseudo_legal
+        # checks their flags, so one that would capture here is skipped
+        if ply is not None and ply < MAX_PLY:
+            for move in self.killers[ply]:
+                if move and not move & tactical and move not in tried and board.is_pseudo_legal(c, move):
+                    tried.append(move)
+                    yield move
+        
+        history = self.history[c]
+        quiets = []
+        moves = board.generate_moves(c, empty)
+        if board.castling:
+            moves.extend(board.castle_moves(c))
+        for move in moves:
+            if move & engine.MOVE_PROMOTION or move in tried:
+                continue
+            x, y = move & 7, move >> 3 & 7
+            quiets.append((history[move & engine.MOVE_SQUARES] - abs(x - 3.5) - abs(y - 3.5), move))
+        quiets.sort(reverse=True)
+        for _, move in quiets:
+            yield move
         
+        losing.sort(reverse=True)
+        for _, move in losing:
+            yield move
+
+    def _search_root(self, board, moves, depth, alpha=-INFINITY, beta=INFINITY):
+        """Search the root moves with PVS and rank them by score for the next iteration.
+
+        Each move is searched ``depth`` plies past the root move itself. Returns
+        (best score, moves best first, principal variation). Moves that tie keep
+        their previous order, so the last iteration's best stays ahead. A move
+        reaching ``beta`` ends the search; the moves after it rank last.
+        """
+        self._attach_tables(board)
+        scores = {}
+        pv = []
+        for i, move in enumerate(moves):
+            undo = board.make_move(move)
+            child_pv = []
+            if i == 0:
+                score = -self.negamax(board, depth, -beta, -alpha, 1, child_pv,
+                                      bool(self.pv) and move == self.pv[0])
+            else:
+                score = -self.negamax(board, depth, -alpha - 1, -alpha, 1, child_pv)
+                if score > alpha:
+                    score = -self.negamax(board, depth, -beta, -alpha, 1, child_pv)
+            board.unmake_move(undo)
+            scores[move] = score
+            if score > alpha:
+                alpha = score
+                pv = [move] + child_pv
+                if score >= beta:
+                    break
+        ranked = sorted(moves, key=lambda move: scores.get(move, -INFINITY), reverse=True)
+        return scores[ranked[0]], ranked, pv
+
+    def _aspiration_search(self, board, moves, depth, previous_score=None):
+        """_search_root in a window around the previous iteration's score.
+
+        A score outside the window is only a bound, so the root is searched
+        again with that side of the window twice as far out, until the
+        window opens fully past ASPIRATION_MAX.
+        """
+        if previous_score is None:
+            return self._search_root(board, moves, depth)
+        self.aspiration_searches += 1
+        delta = ASPIRATION_WINDOW
+        alpha, beta = previous_score - delta, previous_score + delta
+        while True:
+            score, moves, pv = self._search_root(board, moves, depth, alpha, beta)
+            if score <= alpha:
+                self.aspiration_fail_low += 1
+            elif score >= beta:
+                self.aspiration_fail_high += 1
+            else:
+                return score, moves, pv
+            delta *= 2
+            if delta > ASPIRATION_MAX:
+                alpha, beta = -INFINITY, INFINITY
+            elif score <= alpha:
+                alpha = previous_score - delta
+            else:
+                beta = previous_score + delta
+
+    def _search_root_move(self, board, move, depth, alpha):
+        """One root move searched against ``alpha``: null window first, full if it beats it.
+
+        Returns (score, PV from the move on); a score at or below ``alpha``
+        is only an upper bound.
+        """
+        undo = board.make_move(move)
+        child_pv = []
+        score = -self.negamax(board, depth, -alpha - 1, -alpha, 1, child_pv)
+        if score > alpha:
+            score = -self.negamax(board, depth, -INFINITY, -alpha, 1, child_pv)
+        board.unmake_move(undo)
+        return score, [move] + child_pv
+
+    def _iterative_deepening(self, board, moves, depths, start_by=None):
+        """Deepen through ``depths`` until done, ``start_by`` passes or the deadline fires.
+
+        Returns (deepest completed depth or None, its score, root moves ranked
+        by it); ``self.pv`` holds that iteration's principal variation.
+        """
+        completed = score = None
+        try:
+            for depth in depths:
+                # Don't start a depth that cannot finish in time
+                if start_by is not None and time.time() > start_by:
+                    break
+                score, moves, self.pv = self._aspiration_search(board, moves, depth, score)
+                completed = depth
+        except SearchCancelled:
+            pass
+        return completed, score, moves
+
+    def _search(self, board, moves, depths, start_by=None):
+        """Iterative deepening in this process, or across processes when ``smp_workers`` > 1."""
+        if self.smp_workers > 1 and len(moves) > 1:
+            if self.smp_mode == 'root':
+                return self._root_split_search(board, moves, depths, start_by)
+            return self._lazy_smp_search(board, moves, list(depths), start_by)
+        return self._iterative_deepening(board, moves, depths, start_by)
+
+    def _root_split_search(self, board, moves, depths, start_by=None):
+        """Iterative deepening with each iteration's root moves split across processes.
+
+        Returns what _iterative_deepening does. Iterations use the full
+        window rather than aspiration, since the root is never searched as
+        a whole. A shared stop flag ends the helpers' searches when this
+        process finishes or its deadline fires.
+        """
+        stop = shared_memory.SharedMemory(create=True, size=SMP_HEADER_BYTES)
+        futures = []
+        completed = score = None
+        try:
+            stop.buf[:SMP_HEADER_BYTES] = bytes(SMP_HEADER_BYTES)
+            self.search_deadline.add_stop_flag(stop)
+            for depth in depths:
+                if start_by is not None and time.time() > start_by:
+                    break
+                score, moves, self.pv = self._split_root(board, moves, depth, stop.name, futures)
+                completed = depth
+        except SearchCancelled:
+            pass
+        finally:
+            stop.buf[0] = 1
+            self.search_deadline.remove_stop_flag(stop)
+            # Helpers should be done with the flag before it goes; ones that
+            # never started are dropped
+            for future in futures:
+                future.cancel()
+            wait(futures, HELPER_GRACE)
+            stop.close()
+            stop.unlink()
+        return completed, score, moves
+
+    def _split_root(self, board, moves, depth, stop_name, futures):
+        """One root iteration, searched in batches of ``smp_workers`` moves.
+
+        The first move is searched here alone for a bound. Each batch after
+        it is searched against the best score so far, one move here and the
+        rest in helper processes, so later batches cut off against what
+        earlier ones found. Returns what _search_root does.
+        """
+        alpha, _, pv = self._search_root(board, moves[:1], depth)
+        scores = {moves[0]: alpha}
+        helper_board = board.copy()
+        helper_board.psq_tables = None  # helpers attach their own
+        expires_at = self.search_deadline.expires_at
+        start = 1
+        while start < len(moves):
+            # A batch takes as many helpers as are idle, down to none
+            pool, count = _claim_helpers(self.smp_workers - 1)
+            batch = moves[start:start + count + 1]
+            start += len(batch)
+            helpers = [_submit_helper(pool, _root_split_helper, stop_name, helper_board, move, depth, alpha,
+                                      expires_at)
+                       for move in batch[1:]]
+            futures.extend(helpers)
+            # Claims the batch has no moves for go straight back
+            for _ in range(count + 1 - len(batch)):
+                _release_helper(None)
+            results = [self._search_root_move(board, batch[0], depth, alpha)]
+            for helper in helpers:
+                result = self._helper_result(helper)
+                if result is None:
+                    raise SearchCancelled
+                results.append(result[:2])
+                self.helper_nodes += result[2]
+            batch_alpha = alpha
+            for move, (score, move_pv) in zip(batch, results):
+                scores[move] = score
+                if score > batch_alpha:
+                    batch_alpha, pv = score, move_pv
+            alpha = batch_alpha
+        ranked = sorted(moves, key=lambda move: scores[move], reverse=True)
+        return scores[ranked[0]], ranked, pv
+
+    def _lazy_smp_search(self, board, moves, depths, start_by=None):
+        """Search the root in this process and ``smp_workers - 1`` helper processes.
+
+        The transposition table moves into shared memory for the search, so
+        every process probes and stores the same entries; half the helpers
+        start one depth deeper so they run ahead and fill the table for the
+        others. When this process finishes or its deadline fires it raises
+        the shared stop flag, and the deepest completed result wins (this
+        process's on a tie). The table is copied back afterwards so the
+        game keeps it between turns. Only idle helpers join, so with none
+        free the search runs here alone.
+        """
+        pool, count = _claim_helpers(self.smp_workers - 1)
+        if not count:
+            return self._iterative_deepening(board, moves, depths, start_by)
+        own_tt = self.tt
+        tt_bytes = own_tt.size_bytes
+        # SharedMemory may round the size up to whole pages, so the table
+        # is always the exact slice after the header
+        tt_end = SMP_HEADER_BYTES + tt_bytes
+        shm = shared_memory.SharedMemory(create=True, size=tt_end)
+        helpers = []
+        try:
+            shm.buf[:SMP_HEADER_BYTES] = bytes(SMP_HEADER_BYTES)
+            shm.buf[SMP_HEADER_BYTES:tt_end] = memoryview(own_tt.words).cast('B')
+            self.tt = TranspositionTable(buffer=shm.buf[SMP_HEADER_BYTES:tt_end])
+            self.tt.age = own_tt.age
+            
+            expires_at = self.search_deadline.expires_at
+            helper_board = board.copy()
+            helper_board.psq_tables = None  # helpers attach their own
+            helpers = [_submit_helper(pool, _lazy_smp_helper, shm.name, tt_bytes, own_tt.age, helper_board,
+                                      moves, depths[i % 2:] or depths, start_by, expires_at)
+                       for i in range(1, count + 1)]
+            self.search_deadline.add_stop_flag(shm)
+            try:
+                result = self._iterative_deepening(board, moves, depths, start_by)
+                pv = self.pv
+            finally:
+                shm.buf[0] = 1
+                self.search_deadline.remove_stop_flag(shm)
+            for helper in helpers:
+                # Helpers that never started have nothing to add
+                helper.cancel()
+            for helper in helpers:
+                helper_result = self._helper_result(helper)
+                if helper_result is None:
+                    continue
+                completed, score, helper_moves, helper_pv, nodes = helper_result
+                self.helper_nodes += nodes
+                if completed is not None and (result[0] is None or completed > result[0]):
+                    result, pv = (completed, score, helper_moves), helper_pv
+            self.pv = pv
+            return result
+        finally:
+            # Claims that never got a helper go back to the pool
+            for _ in range(count - len(helpers)):
+                _release_helper(None)
+            if self.tt is not own_tt:
+                self.tt.words.release()
+                memoryview(own_tt.words).cast('B')[:] = shm.buf[SMP_HEADER_BYTES:tt_end]
+                self.tt = own_tt
+            shm.close()
+            shm.unlink()
+
+    def _helper_result(self, helper):
+        """A helper process's result, or None if it was dropped or runs on past the deadline."""
+        expires_at = self.search_deadline.expires_at
+        timeout = None if expires_at is None else max(expires_at - time.time(), 0) + HELPER_GRACE
+        try:
+            return helper.result(timeout)
+        except (CancelledError, FutureTimeout):
+            helper.cancel()
+            return None
+
+    def _get_hard_move(self, state):
         # First, ensure we have a fallback move
-        moves = self._get_all_valid_moves_color(state, 'black')
-        if moves:
-            # Always select one move as fallback in case algorithm times out
-            best_move = moves[0]  # Simple fallback
-        else:
+        board, root_moves = self._root_moves(state)
+        self._new_search(board)
+        moves = list(root_moves)
+        if not moves:
             return None  # No valid moves at all
         
         # Use higher depth for hard difficulty adjusted by board complexity
@@ -905,90 +1467,42 @@ class ChessAI:
         
         # First, filter out any moves that would expose our king
         safe_moves = []
-        for piece_idx, move, from_pos in moves:
-            try:
-                sim_state = self.fast_simulate_move(state, piece_idx, move, 'black')
-                if not self.is_king_vulnerable(sim_state, 'black'):
-                    safe_moves.append((piece_idx, move, from_pos))
-            except Exception:
-                continue  # Skip this move if simulation fails
+        for move in moves:
+            undo = board.make_move(move)
+            if not self.is_king_vulnerable(board, 'black'):
+                safe_moves.append(move)
+            board.unmake_move(undo)
         
         # If we have safe moves, use only those. Otherwise use original moves (better than not moving)
         if safe_moves:
             moves = safe_moves
-            # Update fallback to a safe move
-            best_move = moves[0]
         
-        # Order moves to improve search efficiency
-        try:
-            moves = self.order_moves(state, moves, 'black')
-            best_move = moves[0]  # Best ordered move as fallback
-        except Exception:
-            pass  # Keep original moves if ordering fails
+        # Order moves to improve search efficiency; the best ordered move is
+        # the fallback if not even the first iteration completes
+        moves = self.order_moves(board, moves, engine.BLACK, pv_move=self.pv[0] if self.pv else None)
+        best_move = moves[0]
         
         # Use iterative deepening with strict time control
         start_time = time.time()
         time_limit = self.time_limits.get(self.difficulty, 3.0)
         
-        # Set a hard cutoff at 80% of available time
+        # Don't start another depth past 80% of the available time
         hard_time_limit = time_limit * 0.8
         
-        # Use incrementally deeper searches
-        for current_depth in range(1, depth + 1):
-            # Check time before starting this depth
-            if time.time() - start_time > hard_time_limit:
-                break
-                
-            iter_best_move = None
-            iter_best_score = float('-inf')
-            
-            # Process each move with frequent time checks
-            move_counter = 0
-            for piece_idx, move, from_pos in moves:
-                move_counter += 1
-                
-                # Check time every few moves
-                if move_counter % 2 == 0 and time.time() - start_time > hard_time_limit:
-                    break
-                    
-                try:
-                    # Simulate the move
-                    sim_state = self.fast_simulate_move(state, piece_idx, move, 'black')
-                    
-                    # Use a shorter search horizon for minimax
-                    minimax_timeout = (time_limit - (time.time() - start_time)) * 0.7
-                    if minimax_timeout <= 0:
-                        break
-                    
-                    # Start with current depth and reduce if needed
-                    effective_depth = current_depth
-                    if move_counter > 10 and time.time() - start_time > time_limit * 0.6:
-                        effective_depth = max(1, current_depth - 1)  # Reduce depth for later moves
-                    
-                    # Search with minimax
-                    score = self.minimax(sim_state, effective_depth, float('-inf'), float('inf'), False)
-                    
-                    # Keep track of best move
-                    if score > iter_best_score:
-                        iter_best_score = score
-                        iter_best_move = (piece_idx, move, from_pos)
-                except Exception:
-                    continue  # Skip this move if evaluation fails
-            
-            # Update best move if we found something better
-            if iter_best_move:
-                best_move = iter_best_move
-                best_score = iter_best_score
+        # Use incrementally deeper searches, each ranking the root moves for
+        # the next; a cancelled iteration is discarded and the last completed
+        # one stands
+        self.search_deadline = self.deadline.within(time_limit)
+        completed, _, moves = self._search(board, moves, range(1, depth + 1), start_time + hard_time_limit)
+        if completed is not None:
+            best_move = moves[0]
+            self._expect_reply(state, best_move)
         
         # Return the best move we found, or a safe default
-        return best_move
+        return root_moves[best_move]
     
     def _get_grandmaster_move(self, state):
-        # Reset transposition table before each move calculation
-        self.tt = {}
-        
         best_move = None
-        best_score = float('-inf')
         # Increase search depth based on board complexity
         num_pieces = sum(1 for p in state['black_pieces'] if p is not None) + \
                      sum(1 for p in state['white_pieces'] if p is not None)
@@ -1001,38 +1515,27 @@ class ChessAI:
         else:
             depth = 5
             
-        # Use fast_simulate_move instead of simulate_move
-        moves = self._get_all_valid_moves_color(state, 'black')
-        if not moves:
+        board, root_moves = self._root_moves(state)
+        if not root_moves:
             return None
-        moves = self.order_moves(state, moves, 'black')
+        # Reuse this game's tables and PV from earlier turns
+        self._new_search(board)
+        moves = self.order_moves(board, list(root_moves), engine.BLACK, pv_move=self.pv[0] if self.pv else None)
         
         # Add time limit for grandmaster mode too
         start_time = time.time()
         time_limit = 20.0  # 20 seconds max for grandmaster
         
-        # Iterative deepening from depth 3 up to maximum depth
-        for current_depth in range(3, depth + 1):
-            if time.time() - start_time > time_limit:
-                break
-                
-            iter_best_move = None
-            iter_best_score = float('-inf')
-            for piece_idx, move, from_pos in moves:
-                if time.time() - start_time > time_limit:
-                    break
-                # Use fast_simulate_move here too
-                sim_state = self.fast_simulate_move(state, piece_idx, move, 'black')
-                score = self.minimax(sim_state, current_depth, float('-inf'), float('inf'), False)
-                if score > iter_best_score:
-                    iter_best_score = score
-                    iter_best_move = (piece_idx, move, from_pos)
-            if iter_best_move:
-                best_move = iter_best_move
-                best_score = iter_best_score
-        if best_move is None and moves:
-            return self._get_medium_move(state, moves)
-        return best_move
+        # Iterative deepening from depth 3 up to maximum depth; when the
+        # deadline fires mid-iteration the last completed one stands
+        self.search_deadline = self.deadline.within(time_limit)
+        completed, _, moves = self._search(board, moves, range(3, depth + 1), start_time + time_limit)
+        if completed is not None:
+            best_move = moves[0]
+            self._expect_reply(state, best_move)
+        if best_move is None:
+            return self._get_medium_move(state, [root_moves[move] for move in moves])
+        return root_moves[best_move]
         
     # Add a quick evaluation function for non-terminal positions
     def evaluate_board_quick(self, state):
@@ -1058,7 +1561,8 @@ class ChessAI:
             
         return black_score - white_score
 
-def is_check(color, white_locs, black_locs):
-    # Temporary stub function.
-    # FIXME: Replace with proper check detection logic shared with app.py
-    return False
+def is_check(color, state):
+    """Whether ``color``'s king is attacked in a session-style state, as app.is_check decides it."""
+    board = engine.Position(state['white_pieces'], state['white_locations'],
+                            state['black_pieces'], state['black_locations'])
+    return board.in_check(engine.color_index(color))
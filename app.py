@@ -1,8 +1,12 @@
 from flask import Flask, render_template, request, jsonify, send_from_directory, session
 import os
 import random
-import copy
-from ai_agent import ChessAI  # Import our new AI agent
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import engine
+from ai_agent import ChessAI, Deadline, start_search_pool  # Import our new AI agent
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'
@@ -11,8 +15,48 @@ app.secret_key = 'your_secret_key_here'
 WIDTH = 1000
 HEIGHT = 900
 
-# Create AI instance
-chess_ai = ChessAI(difficulty='medium')
+# One AI instance per game, so each game keeps its own transposition table
+# between AI turns. Only the most recently used games stay in memory.
+MAX_AI_GAMES = 8
+ai_games = OrderedDict()
+ai_games_lock = threading.Lock()
+
+# Processes searching each hard or grandmaster move, including the request's
+# own; more than 1 uses Lazy SMP over a shared transposition table
+AI_SEARCH_WORKERS = int(os.environ.get('CHESS_AI_WORKERS', '1'))
+# 'lazy' (shared transposition table) or 'root' (root moves split up)
+AI_SEARCH_MODE = os.environ.get('CHESS_AI_SMP_MODE', 'lazy')
+# The helper processes start with the server, not with its first search
+start_search_pool(AI_SEARCH_WORKERS)
+
+def get_game_ai(state):
+    """The ChessAI that owns this game's search state, created on first use."""
+    game_id = state.get('game_id')
+    if game_id is None:
+        # Sessions started before games had ids get one now
+        game_id = state['game_id'] = uuid.uuid4().hex
+    with ai_games_lock:
+        game_ai = ai_games.get(game_id)
+        if game_ai is None:
+            difficulty = state.get('difficulty', 'medium')
+            game_ai = ChessAI(difficulty=difficulty)
+            # Add time limits for better AI performance
+            if difficulty == 'hard':
+                game_ai.time_limits['hard'] = 5.0  # Reduced time for faster play
+            if difficulty in ('hard', 'grandmaster'):
+                game_ai.smp_workers = AI_SEARCH_WORKERS
+                game_ai.smp_mode = AI_SEARCH_MODE
+            ai_games[game_id] = game_ai
+            while len(ai_games) > MAX_AI_GAMES:
+                ai_games.popitem(last=False)
+        else:
+            ai_games.move_to_end(game_id)
+    return game_ai
+
+def drop_game_ai(state):
+    """Forget a finished or abandoned game's AI."""
+    with ai_games_lock:
+        ai_games.pop(state.get('game_id'), None)
 
 # Initialize game state per session
 def init_game_state(starting_turn=0):
@@ -39,7 +83,8 @@ def init_game_state(starting_turn=0):
         'white_options': [],
         'black_options': [],
         'last_move': None,
-        'previous_winner': None  # Track the previous game winner
+        'previous_winner': None,  # Track the previous game winner
+        'game_id': uuid.uuid4().hex  # Keys this game's AI search state
     }
 
 @app.before_request
@@ -51,214 +96,48 @@ def before_request():
 for directory in ['images', 'audio', 'static']:
     os.makedirs(directory, exist_ok=True)
 
-def check_pawn(position, color, cur_white_locations=None, cur_black_locations=None):
+def _board_locations(cur_white_locations=None, cur_black_locations=None):
     # Get locations from session state if not provided
     state = session.get('game_state', {})
     white_locs = cur_white_locations if cur_white_locations is not None else state.get('white_locations', [])
     black_locs = cur_black_locations if cur_black_locations is not None else state.get('black_locations', [])
-    
-    moves_list = []
-    x, y = position
-    if color == 'white':
-        if (x, y + 1) not in white_locs + black_locs and y + 1 <= 7:
-            moves_list.append((x, y + 1))
-        if y == 1 and (x, y + 2) not in white_locs + black_locs and (x, y + 1) not in white_locs + black_locs:
-            moves_list.append((x, y + 2))
-        if (x + 1, y + 1) in black_locs:
-            moves_list.append((x + 1, y + 1))
-        if (x - 1, y + 1) in black_locs:
-            moves_list.append((x - 1, y + 1))
-    else:
-        if (x, y - 1) not in white_locs + black_locs and y - 1 >= 0:
-            moves_list.append((x, y - 1))
-        if y == 6 and (x, y - 2) not in white_locs + black_locs and (x, y - 1) not in white_locs + black_locs:
-            moves_list.append((x, y - 2))
-        if (x + 1, y - 1) in white_locs:
-            moves_list.append((x + 1, y - 1))
-        if (x - 1, y - 1) in white_locs:
-            moves_list.append((x - 1, y - 1))
-    return moves_list
+    return white_locs, black_locs
+
+def check_pawn(position, color, cur_white_locations=None, cur_black_locations=None):
+    white_locs, black_locs = _board_locations(cur_white_locations, cur_black_locations)
+    return engine.moves_from('pawn', position, color, white_locs, black_locs)
 
 def check_rook(position, color, cur_white_locations=None, cur_black_locations=None):
-    state = session.get('game_state', {})
-    white_locs = cur_white_locations if cur_white_locations is not None else state.get('white_locations', [])
-    black_locs = cur_black_locations if cur_black_locations is not None else state.get('black_locations', [])
-    
-    moves_list = []
-    x, y = position
-    for dx, dy in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
-        nx, ny = x + dx, y + dy
-        while 0 <= nx <= 7 and 0 <= ny <= 7:
-            current_pos = (nx, ny)
-            if current_pos in white_locs:
-                if color=='black':
-                    moves_list.append(current_pos)
-                break
-            elif current_pos in black_locs:
-                if color=='white':
-                    moves_list.append(current_pos)
-                break
-            else:
-                moves_list.append(current_pos)
-            nx += dx
-            ny += dy
-    return moves_list
+    white_locs, black_locs = _board_locations(cur_white_locations, cur_black_locations)
+    return engine.moves_from('rook', position, color, white_locs, black_locs)
 
 def check_knight(position, color, cur_white_locations=None, cur_black_locations=None):
-    state = session.get('game_state', {})
-    white_locs = cur_white_locations if cur_white_locations is not None else state.get('white_locations', [])
-    black_locs = cur_black_locations if cur_black_locations is not None else state.get('black_locations', [])
-    
-    moves_list = []
-    x, y = position
-    targets = [(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)]
-    for dx, dy in targets:
-        nx, ny = x + dx, y + dy
-        if 0 <= nx <= 7 and 0 <= ny <= 7:
-            # Knight can jump over pieces; only disallow if target is a friendly piece.
-            if color == 'white':
-                if (nx, ny) not in white_locs:
-                    moves_list.append((nx, ny))
-            else:
-                if (nx, ny) not in black_locs:
-                    moves_list.append((nx, ny))
-    return moves_list
+    white_locs, black_locs = _board_locations(cur_white_locations, cur_black_locations)
+    return engine.moves_from('knight', position, color, white_locs, black_locs)
 
 def check_bishop(position, color, cur_white_locations=None, cur_black_locations=None):
-    state = session.get('game_state', {})
-    white_locs = cur_white_locations if cur_white_locations is not None else state.get('white_locations', [])
-    black_locs = cur_black_locations if cur_black_locations is not None else state.get('black_locations', [])
-    
-    moves_list = []
-    x,y = position
-    for dx, dy in [(1,1),(1,-1),(-1,1),(-1,-1)]:
-        nx, ny = x+dx, y+dy
-        while 0<=nx<=7 and 0<=ny<=7:
-            current_pos = (nx, ny)
-            if current_pos in white_locs:
-                if color=='black':
-                    moves_list.append(current_pos)
-                break
-            elif current_pos in black_locs:
-                if color=='white':
-                    moves_list.append(current_pos)
-                break
-            else:
-                moves_list.append(current_pos)
-            nx += dx
-            ny += dy
-    return moves_list
+    white_locs, black_locs = _board_locations(cur_white_locations, cur_black_locations)
+    return engine.moves_from('bishop', position, color, white_locs, black_locs)
 
 def check_queen(position, color, cur_white_locations=None, cur_black_locations=None):
-    moves_list = []
-    moves_list.extend(check_rook(position, color, cur_white_locations, cur_black_locations))
-    moves_list.extend(check_bishop(position, color, cur_white_locations, cur_black_locations))
-    return moves_list
+    white_locs, black_locs = _board_locations(cur_white_locations, cur_black_locations)
+    return engine.moves_from('queen', position, color, white_locs, black_locs)
 
 def check_king_moves(position, color, index, cur_white_locations=None, cur_black_locations=None):
-    state = session.get('game_state', {})
-    white_locs = cur_white_locations if cur_white_locations is not None else state.get('white_locations', [])
-    black_locs = cur_black_locations if cur_black_locations is not None else state.get('black_locations', [])
-    
-    moves_list = []
-    if color == 'white':
-        friends_list = white_locs
-    else:
-        friends_list = black_locs
-    targets = [(1, 0), (1, 1), (1, -1), (-1, 0), (-1, 1), (-1, -1), (0, 1), (0, -1)]
-    for t in targets:
-        target = (position[0] + t[0], position[1] + t[1])
-        if 0 <= target[0] <= 7 and 0 <= target[1] <= 7 and target not in friends_list:
-            moves_list.append(target)
-    return moves_list
+    white_locs, black_locs = _board_locations(cur_white_locations, cur_black_locations)
+    return engine.moves_from('king', position, color, white_locs, black_locs)
 
 def check_king(position, color, index, cur_white_locations=None, cur_black_locations=None):
     state = session.get('game_state', {})
-    white_locs = cur_white_locations if cur_white_locations is not None else state.get('white_locations', [])
-    black_locs = cur_black_locations if cur_black_locations is not None else state.get('black_locations', [])
-    white_pieces = state.get('white_pieces', [])
-    black_pieces = state.get('black_pieces', [])
-    white_moved = state.get('white_moved', [])
-    black_moved = state.get('black_moved', [])
-    
-    moves_list = []
-    castle_moves = []
-    if color == 'white':
-        friends_list = white_locs
-        moved = white_moved
-        initial_king = (3, 0)  # Updated: white king now starts at (3, 0)
-        kingside_rook_pos = (7, 0)
-        queenside_rook_pos = (0, 0)
-    else:
-        friends_list = black_locs
-        moved = black_moved
-        initial_king = (3, 7)  # Updated: black king now starts at (3, 7)
-        kingside_rook_pos = (7, 7)
-        queenside_rook_pos = (0, 7)
-    targets = [(1, 0), (1, 1), (1, -1), (-1, 0), (-1, 1), (-1, -1), (0, 1), (0, -1)]
-    for t in targets:
-        target = (position[0] + t[0], position[1] + t[1])
-        if 0 <= target[0] <= 7 and 0 <= target[1] <= 7 and target not in friends_list:
-            moves_list.append(target)
-    # Castling valid only if king is on its initial square, hasn't moved, and isn't in check.
-    if position == initial_king and not moved[index] and not is_check(color, cur_white_locations, cur_black_locations):
-        # Kingside castling check:
-        try:
-            rook_index = white_locs.index(kingside_rook_pos) if color == 'white' else black_locs.index(kingside_rook_pos)
-            if not moved[rook_index]:
-                if color == 'white':
-                    # For white: require squares (4,0) and (5,0) to be clear.
-                    if ((4, 0) not in white_locs + black_locs) and ((5, 0) not in white_locs + black_locs):
-                        temp1 = copy.deepcopy(white_locs)
-                        king_idx = white_pieces.index('king')
-                        temp1[king_idx] = (4, 0)
-                        temp2 = copy.deepcopy(white_locs)
-                        temp2[king_idx] = (5, 0)
-                        if (not is_check(color, cur_white_locations=temp1, cur_black_locations=black_locs) and
-                                not is_check(color, cur_white_locations=temp2, cur_black_locations=black_locs)):
-                            castle_moves.append((5, 0, 'castle_kingside'))
-                else:
-                    # For black: require squares (4,7) and (5,7) clear.
-                    if ((4, 7) not in white_locs + black_locs) and ((5, 7) not in white_locs + black_locs):
-                        temp1 = copy.deepcopy(black_locs)
-                        king_idx = black_pieces.index('king')
-                        temp1[king_idx] = (4, 7)
-                        temp2 = copy.deepcopy(black_locs)
-                        temp2[king_idx] = (5, 7)
-                        if (not is_check(color, cur_black_locations=temp1, cur_white_locations=white_locs) and
-                                not is_check(color, cur_black_locations=temp2, cur_white_locations=white_locs)):
-                            castle_moves.append((5, 7, 'castle_kingside'))
-        except ValueError:
-            pass
-        # Queenside castling check:
-        try:
-            rook_index = white_locs.index(queenside_rook_pos) if color == 'white' else black_locs.index(queenside_rook_pos)
-            if not moved[rook_index]:
-                if color == 'white':
-                    # For white: require squares (1,0) and (2,0) to be clear.
-                    if ((1, 0) not in white_locs + black_locs) and ((2, 0) not in white_locs + black_locs):
-                        temp1 = copy.deepcopy(white_locs)
-                        king_idx = white_pieces.index('king')
-                        temp1[king_idx] = (1, 0)
-                        temp2 = copy.deepcopy(white_locs)
-                        temp2[king_idx] = (2, 0)
-                        if (not is_check(color, cur_white_locations=temp1, cur_black_locations=black_locs) and
-                                not is_check(color, cur_white_locations=temp2, cur_black_locations=black_locs)):
-                            castle_moves.append((1, 0, 'castle_queenside'))
-                else:
-                    # For black: require squares (1,7) and (2,7) clear.
-                    if ((1, 7) not in white_locs + black_locs) and ((2, 7) not in white_locs + black_locs):
-                        temp1 = copy.deepcopy(black_locs)
-                        king_idx = black_pieces.index('king')
-                        temp1[king_idx] = (1, 7)
-                        temp2 = copy.deepcopy(black_locs)
-                        temp2[king_idx] = (2, 7)
-                        if (not is_check(color, cur_black_locations=temp1, cur_white_locations=white_locs) and
-                                not is_check(color, cur_black_locations=temp2, cur_white_locations=white_locs)):
-                            castle_moves.append((1, 7, 'castle_queenside'))
-        except ValueError:
-            pass
-    moves_list.extend(castle_moves)
+    white_locs, black_locs = _board_locations(cur_white_locations, cur_black_locations)
+    board = engine.Position(state.get('white_pieces', []), white_locs, state.get('black_pieces', []), black_locs)
+    board.set_castling(state.get('white_moved'), state.get('black_moved'))
+    
+    moves_list = board.moves('king', position, color)
+    # Castling valid only if king is on its initial square, hasn't moved, isn't in check
+    # and doesn't pass through an attacked square.
+    for move in board.castle_moves(engine.color_index(color)):
+        moves_list.append(board.app_move(move))
     return moves_list
 
 def check_valid_moves(locations, options, selection):
@@ -267,169 +146,45 @@ def check_valid_moves(locations, options, selection):
     if selection == 100:
         return []
     color = 'white' if state['turn_step'] % 2 == 0 else 'black'
-    valid_moves = []
-    if color == 'white':
-        piece = state['white_pieces'][selection]
-        current_pos = state['white_locations'][selection]
-    else:
-        piece = state['black_pieces'][selection]
-        current_pos = state['black_locations'][selection]
-    # Build simulation state copies using deep copy
-    sim_white = copy.deepcopy(state['white_locations'])
-    sim_black = copy.deepcopy(state['black_locations'])
-    sim_white_pieces = copy.deepcopy(state['white_pieces'])
-    sim_black_pieces = copy.deepcopy(state['black_pieces'])
-    if piece == 'pawn':
-        all_moves = check_pawn(current_pos, color, sim_white, sim_black)
-    elif piece == 'rook':
-        all_moves = check_rook(current_pos, color, sim_white, sim_black)
-    elif piece == 'knight':
-        all_moves = check_knight(current_pos, color, sim_white, sim_black)
-    elif piece == 'bishop':
-        all_moves = check_bishop(current_pos, color, sim_white, sim_black)
-    elif piece == 'queen':
-        all_moves = check_queen(current_pos, color, sim_white, sim_black)
-    elif piece == 'king':
-        all_moves = check_king(current_pos, color, selection, sim_white, sim_black)
-    for move in all_moves:
-        sim_white = copy.deepcopy(state['white_locations'])
-        sim_black = copy.deepcopy(state['black_locations'])
-        sim_white_pieces = copy.deepcopy(state['white_pieces'])
-        sim_black_pieces = copy.deepcopy(state['black_pieces'])
-        move_coords = move if isinstance(move, tuple) else move[:2]
-        if color == 'white':
-            if move_coords in state['black_locations']:
-                captured_idx = state['black_locations'].index(move_coords)
-                sim_black[captured_idx] = (-1, -1)
-                sim_black_pieces[captured_idx] = None
-            sim_white[selection] = move_coords
-        else:
-            if move_coords in state['white_locations']:
-                captured_idx = state['white_locations'].index(move_coords)
-                sim_white[captured_idx] = (-1, -1)
-                sim_white_pieces[captured_idx] = None
-            sim_black[selection] = move_coords
-        if not is_check(color, sim_white, sim_black, sim_white_pieces, sim_black_pieces):
-            valid_moves.append(move)
-    return valid_moves
+    current_pos = state[color + '_locations'][selection]
+    board = engine.Position.from_state(state)
+    from_sq = engine.square(*current_pos)
+    # The legal generator handles pins and check evasions itself, so there is no simulate-and-test loop
+    return [board.app_move(move) for move in board.legal_moves(engine.color_index(color))
+            if engine.move_from(move) == from_sq]
 
 def is_check(color, cur_white_locations=None, cur_black_locations=None, cur_white_pieces=None, cur_black_pieces=None):
     state = session.get('game_state', {})
-    white_locs = cur_white_locations if cur_white_locations is not None else state.get('white_locations', [])
-    black_locs = cur_black_locations if cur_black_locations is not None else state.get('black_locations', [])
+    white_locs, black_locs = _board_locations(cur_white_locations, cur_black_locations)
     white_pcs = cur_white_pieces if cur_white_pieces is not None else state.get('white_pieces', [])
     black_pcs = cur_black_pieces if cur_black_pieces is not None else state.get('black_pieces', [])
-    try:
-        if color == 'white':
-            if 'king' not in white_pcs:
-                return False
-            king_index = white_pcs.index('king')
-            king_pos = white_locs[king_index]
-            enemy_pcs = black_pcs
-            enemy_locs = black_locs
-        else:
-            if 'king' not in black_pcs:
-                return False
-            king_index = black_pcs.index('king')
-            king_pos = black_locs[king_index]
-            enemy_pcs = white_pcs
-            enemy_locs = white_locs
-        for i, piece in enumerate(enemy_pcs):
-            if piece is None:
-                continue
-            pos = enemy_locs[i]
-            if piece == 'pawn':
-                moves = check_pawn(pos, 'black' if color == 'white' else 'white', cur_white_locations, cur_black_locations)
-            elif piece == 'rook':
-                moves = check_rook(pos, 'black' if color == 'white' else 'white', cur_white_locations, cur_black_locations)
-            elif piece == 'knight':
-                moves = check_knight(pos, 'black' if color == 'white' else 'white', cur_white_locations, cur_black_locations)
-            elif piece == 'bishop':
-                moves = check_bishop(pos, 'black' if color == 'white' else 'white', cur_white_locations, cur_black_locations)
-            elif piece == 'queen':
-                moves = check_queen(pos, 'black' if color == 'white' else 'white', cur_white_locations, cur_black_locations)
-            elif piece == 'king':
-                moves = check_king_moves(pos, 'black' if color == 'white' else 'white', i, cur_white_locations, cur_black_locations)
-            if king_pos in moves:
-                return True
-    except ValueError:
-        return False
-    return False
+    board = engine.Position(white_pcs, white_locs, black_pcs, black_locs)
+    return board.in_check(engine.color_index(color))
 
 def check_mate(color):
     """Return True if no legal move exists for piece(s) to remove check"""
     state = session.get('game_state', {})
-    if not is_check(color):
-        return False
-    pieces = state['white_pieces'] if color == 'white' else state['black_pieces']
-    locations = state['white_locations'] if color == 'white' else state['black_locations']
-    for i in range(len(pieces)):
-        if pieces[i] is None:
-            continue
-        sim_white = copy.deepcopy(state['white_locations'])
-        sim_black = copy.deepcopy(state['black_locations'])
-        sim_white_pieces = copy.deepcopy(state['white_pieces'])
-        sim_black_pieces = copy.deepcopy(state['black_pieces'])
-        current_pos = locations[i]
-        if pieces[i] == 'pawn':
-            moves = check_pawn(current_pos, color, sim_white, sim_black)
-        elif pieces[i] == 'rook':
-            moves = check_rook(current_pos, color, sim_white, sim_black)
-        elif pieces[i] == 'knight':
-            moves = check_knight(current_pos, color, sim_white, sim_black)
-        elif pieces[i] == 'bishop':
-            moves = check_bishop(current_pos, color, sim_white, sim_black)
-        elif pieces[i] == 'queen':
-            moves = check_queen(current_pos, color, sim_white, sim_black)
-        elif pieces[i] == 'king':
-            moves = check_king(current_pos, color, i, sim_white, sim_black)
-        for move in moves:
-            sim_white = copy.deepcopy(state['white_locations'])
-            sim_black = copy.deepcopy(state['black_locations'])
-            sim_white_pieces = copy.deepcopy(state['white_pieces'])
-            sim_black_pieces = copy.deepcopy(state['black_pieces'])
-            move_coords = move if isinstance(move, tuple) else move[:2]
-            if color == 'white':
-                if move_coords in state['black_locations']:
-                    captured_idx = state['black_locations'].index(move_coords)
-                    sim_black[captured_idx] = (-1, -1)
-                    sim_black_pieces[captured_idx] = None
-                sim_white[i] = move_coords
-            else:
-                if move_coords in state['white_locations']:
-                    captured_idx = state['white_locations'].index(move_coords)
-                    sim_white[captured_idx] = (-1, -1)
-                    sim_white_pieces[captured_idx] = None
-                sim_black[i] = move_coords
-            if not is_check(color, sim_white, sim_black, sim_white_pieces, sim_black_pieces):
-                return False
-    return True
+    board = engine.Position.from_state(state)
+    c = engine.color_index(color)
+    return bool(board.checkers(c)) and not board.legal_moves(c)
 
-def check_options(pieces, locations, turn):
+def check_options(pieces, locations, turn, board=None):
     all_moves_list = []
     state = session.get('game_state', {})
+    # One bitboard snapshot of the board serves every piece on this side
+    if board is None:
+        board = engine.Position.from_state(state)
     for i in range(len(pieces)):
         # Skip pieces that are captured
         if pieces[i] is None:
             all_moves_list.append([])
             continue
         if turn == 'white' or turn == 'black':
-            # Use deep copies of board state for accuracy
-            sim_white = copy.deepcopy(state['white_locations'])
-            sim_black = copy.deepcopy(state['black_locations'])
             piece = pieces[i]
-            if piece == 'pawn':
-                moves_list = check_pawn(locations[i], turn, sim_white, sim_black)
-            elif piece == 'rook':
-                moves_list = check_rook(locations[i], turn, sim_white, sim_black)
-            elif piece == 'knight':
-                moves_list = check_knight(locations[i], turn, sim_white, sim_black)
-            elif piece == 'bishop':
-                moves_list = check_bishop(locations[i], turn, sim_white, sim_black)
-            elif piece == 'queen':
-                moves_list = check_queen(locations[i], turn, sim_white, sim_black)
-            elif piece == 'king':
-                moves_list = check_king(locations[i], turn, i, sim_white, sim_black)
+            if piece == 'king':
+                moves_list = check_king(locations[i], turn, i)
+            else:
+                moves_list = board.moves(piece, locations[i], turn)
             all_moves_list.append(moves_list)
     return all_moves_list
 
@@ -484,41 +239,39 @@ def make_move():
         'to': tuple(move) if isinstance(move, list) else move
     }
     
+    # Mailbox view of the board for O(1) square lookups, kept in step with the lists below
+    board = engine.Position.from_state(state)
+    side = 'white' if state['turn_step'] % 2 == 0 else 'black'
+    
     captured_index = None
     checkmate_state = False
-    if move in enemies_list:
-        captured_index = enemies_list.index(move)
-        if enemies_pieces[captured_index] == 'king':
+    target = board.piece_at(*move)
+    if target is not None and target[0] != side:
+        captured_index = board.index_at(*move)
+        if target[1] == 'king':
             state['game_over'] = True
-            state['winner'] = 'white' if state['turn_step'] % 2 == 0 else 'black'
+            state['winner'] = side
             # Force more prominent notification
             check_val = 'checkmate'
             checkmate_state = True
     
     # Update piece location
+    start_pos = tuple(locations[piece_index])
+    board.move_piece(engine.square(*start_pos), engine.square(*move))
     locations[piece_index] = move
     moved[piece_index] = True
     
     # Handle castling: update both king and rook positions based on new initial positions.
-    if pieces[piece_index] == 'king':
-        if state['turn_step'] % 2 == 0:  # White's turn; white king starts at (3, 0)
-            if move == (5, 0):  # Kingside castling: king from (3,0) to (5,0)
-                rook_index = state['white_locations'].index((7, 0))
-                state['white_locations'][rook_index] = (4, 0)
-                state['white_moved'][rook_index] = True
-            elif move == (1, 0):  # Queenside castling: king from (3,0) to (1,0)
-                rook_index = state['white_locations'].index((0, 0))
-                state['white_locations'][rook_index] = (2, 0)
-                state['white_moved'][rook_index] = True
-        else:  # Black's turn; black king starts at (3, 7)
-            if move == (5, 7):  # Kingside castling: king from (3,7) to (5,7)
-                rook_index = state['black_locations'].index((7, 7))
-                state['black_locations'][rook_index] = (4, 7)
-                state['black_moved'][rook_index] = True
-            elif move == (1, 7):  # Queenside castling: king from (3,7) to (1,7)
-                rook_index = state['black_locations'].index((0, 7))
-                state['black_locations'][rook_index] = (2, 7)
-                state['black_moved'][rook_index] = True
+    # White king starts at (3, 0), black king at (3, 7).
+    rank = 0 if side == 'white' else 7
+    if pieces[piece_index] == 'king' and start_pos == (3, rank):
+        for king_to, rook_from, rook_to in [((5, rank), (7, rank), (4, rank)),  # Kingside castling
+                                            ((1, rank), (0, rank), (2, rank))]:  # Queenside castling
+            if move == king_to and board.piece_at(*rook_from) == (side, 'rook'):
+                rook_index = board.index_at(*rook_from)
+                board.move_piece(engine.square(*rook_from), engine.square(*rook_to))
+                locations[rook_index] = rook_to
+                moved[rook_index] = True
 
     # Mark captured piece instead of pop
     if captured_index is not None:
@@ -541,8 +294,8 @@ def make_move():
                 'index': piece_index
             }
     
-    state['black_options'] = check_options(state['black_pieces'], state['black_locations'], 'black')
-    state['white_options'] = check_options(state['white_pieces'], state['white_locations'], 'white')
+    state['black_options'] = check_options(state['black_pieces'], state['black_locations'], 'black', board)
+    state['white_options'] = check_options(state['white_pieces'], state['white_locations'], 'white', board)
     
     current_side = 'white' if state['turn_step'] % 2 == 1 else 'black'
     opponent_side = 'black' if state['turn_step'] % 2 == 1 else 'white'
@@ -763,6 +516,7 @@ def restart_game():
     if 'game_state' in session:
         state = session.get('game_state', {})
         previous_winner = state.get('previous_winner')
+        drop_game_ai(state)
 
     # Completely reset the game state
     init_game_state()
@@ -772,18 +526,15 @@ def restart_game():
     if previous_winner:
         state['previous_winner'] = previous_winner
 
-    # Update the chess_ai instance's difficulty
-    chess_ai.difficulty = difficulty
-    
-    # Add time limits for better AI performance
-    if difficulty == 'hard':
-        chess_ai.time_limits['hard'] = 5.0  # Reduced time for faster play
-    
     # Set AI game flag if playing against AI
     state['vs_ai'] = vs_ai
     state['ai_color'] = ai_color
     state['difficulty'] = difficulty  # Store difficulty in game state
     
+    # A fresh game id means a fresh AI, created at the requested difficulty
+    if vs_ai:
+        get_game_ai(state)
+    
     # Calculate options for both sides after reset
     state['black_options'] = check_options(state['black_pieces'], state['black_locations'], 'black')
     state['white_options'] = check_options(state['white_pieces'], state['white_locations'], 'white')
@@ -833,10 +584,20 @@ def ai_move():
     if state['turn_step'] % 2 != 1:
         return jsonify({'error': 'Not AI\'s turn'}), 400
     
-    # Set a timeout for the AI to prevent hanging
-    import threading
-    import time
-    from concurrent.futures import ThreadPoolExecutor, TimeoutError
+    chess_ai = get_game_ai(state)
+    
+    # Different timeout based on difficulty
+    difficulty = state.get('difficulty', 'medium')
+    timeout_seconds = 10  # Default
+    if difficulty == 'easy':
+        timeout_seconds = 3
+    elif difficulty == 'medium':
+        timeout_seconds = 6
+    elif difficulty == 'hard':
+        timeout_seconds = 10
+    # The search stops itself shortly before the timeout and plays its last
+    # completed iteration; cancel() stops it outright
+    deadline = Deadline(timeout_seconds * 0.9)
     
     # Function to get AI move with timeout protection
     def get_ai_move_with_timeout():
@@ -845,11 +606,8 @@ def ai_move():
             difficulty = state.get('difficulty', 'medium')
             chess_ai.difficulty = difficulty
             
-            # Start with a timer
-            start_time = time.time()
-            
             # Try to get a move
-            ai_move = chess_ai.get_move(state)
+            ai_move = chess_ai.get_move(state, deadline)
             
             # If we get a move, return it
             if ai_move:
@@ -891,19 +649,14 @@ def ai_move():
     
     # Execute with timeout
     try:
-        # Different timeout based on difficulty
-        difficulty = state.get('difficulty', 'medium')
-        timeout_seconds = 10  # Default
-        if difficulty == 'easy':
-            timeout_seconds = 3
-        elif difficulty == 'medium':
-            timeout_seconds = 6
-        elif difficulty == 'hard':
-            timeout_seconds = 10
-            
         with ThreadPoolExecutor() as executor:
             future = executor.submit(get_ai_move_with_timeout)
-            ai_move = future.result(timeout=timeout_seconds)
+            try:
+                ai_move = future.result(timeout=timeout_seconds)
+            except TimeoutError:
+                # Stop the search thread before the executor waits for it
+                deadline.cancel()
+                raise
             
             if not ai_move:
                 # If still no move, use absolute last resort - pick any valid move
@@ -937,6 +690,7 @@ def ai_move():
         return jsonify({'error': 'AI could not determine a valid move'}), 200
         
     piece_index, move, from_pos = ai_move
+    move = tuple(move[:2])  # Castling options carry a trailing label
     
     # Process the move (similar to the make_move function)
     pieces = state['black_pieces']
@@ -951,29 +705,32 @@ def ai_move():
         'to': move
     }
     
-    # Check for captures
+    # Check for captures with an O(1) mailbox lookup
+    board = engine.Position.from_state(state)
     captured_index = None
     checkmate_state = False
-    if move in enemies_list:
-        captured_index = enemies_list.index(move)
-        if enemies_pieces[captured_index] == 'king':
+    target = board.piece_at(*move)
+    if target is not None and target[0] == 'white':
+        captured_index = board.index_at(*move)
+        if target[1] == 'king':
             state['game_over'] = True
             state['winner'] = 'black'
     
     # Update piece location
+    start_pos = tuple(locations[piece_index])
+    board.move_piece(engine.square(*start_pos), engine.square(*move))
     locations[piece_index] = move
     moved[piece_index] = True
     
-    # Handle castling for AI
-    if pieces[piece_index] == 'king':
-        if move == (5, 7):  # Kingside castling
-            rook_index = state['black_locations'].index((7, 7))
-            state['black_locations'][rook_index] = (4, 7)
-            state['black_moved'][rook_index] = True
-        elif move == (1, 7):  # Queenside castling
-            rook_index = state['black_locations'].index((0, 7))
-            state['black_locations'][rook_index] = (2, 7)
-            state['black_moved'][rook_index] = True
+    # Handle castling for AI (king from (3, 7))
+    if pieces[piece_index] == 'king' and start_pos == (3, 7):
+        for king_to, rook_from, rook_to in [((5, 7), (7, 7), (4, 7)),  # Kingside castling
+                                            ((1, 7), (0, 7), (2, 7))]:  # Queenside castling
+            if move == king_to and board.piece_at(*rook_from) == ('black', 'rook'):
+                rook_index = board.index_at(*rook_from)
+                board.move_piece(engine.square(*rook_from), engine.square(*rook_to))
+                locations[rook_index] = rook_to
+                moved[rook_index] = True
 
     # Handle captures
     if captured_index is not None:
@@ -986,10 +743,11 @@ def ai_move():
     if pieces[piece_index] == 'pawn' and move[1] == 0:
         # AI always promotes to queen
         state['black_pieces'][piece_index] = 'queen'
+        board.set_piece_type(engine.square(*move), 'queen')
     
     # Recalculate options after move
-    state['black_options'] = check_options(state['black_pieces'], state['black_locations'], 'black')
-    state['white_options'] = check_options(state['white_pieces'], state['white_locations'], 'white')
+    state['black_options'] = check_options(state['black_pieces'], state['black_locations'], 'black', board)
+    state['white_options'] = check_options(state['white_pieces'], state['white_locations'], 'white', board)
     
     # Check for check/checkmate conditions
     current_side = 'white'
@@ -0,0 +1,697 @@
+"""Micro-benchmarks for the move generator and search.
+
+Run ``python bench.py`` for every benchmark or ``python bench.py movegen``
+for a single one. Each benchmark prints the old list-scanning numbers next
+to the current engine so regressions show up as a before/after pair.
+"""
+import copy
+import sys
+import time
+
+import engine
+from ai_agent import ChessAI, Deadline, SearchCancelled
+from transposition import EvalCache, PawnHashTable
+
+# Positions use FEN piece placement with rank 8 as y == 7 and file a as x == 0.
+# The start position mirrors init_game_state (king on the d-file).
+BENCH_POSITIONS = {
+    'start': 'rnbkqbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBKQBNR',
+    'middlegame': 'r2k1b1r/ppp1qppp/2np1n2/4p1B1/2B1P1b1/2NP1N2/PPP1QPPP/R2K3R',
+    'open': 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R',
+    'endgame': '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8',
+}
+
+
+def load_placement(placement):
+    """Session-style piece and location lists from a FEN piece placement."""
+    names = {'p': 'pawn', 'n': 'knight', 'b': 'bishop', 'r': 'rook', 'q': 'queen', 'k': 'king'}
+    state = {'white_pieces': [], 'white_locations': [], 'black_pieces': [], 'black_locations': []}
+    for row, rank in enumerate(placement.split('/')):
+        y = 7 - row
+        x = 0
+        for ch in rank:
+            if ch.isdigit():
+                x += int(ch)
+                continue
+            color = 'white' if ch.isupper() else 'black'
+            state[color + '_pieces'].append(names[ch.lower()])
+            state[color + '_locations'].append((x, y))
+            x += 1
+    return state
+
+
+# Reference list-scanning generators, kept verbatim from the implementation
+# the bitboard engine replaced so the benchmarks have a fixed baseline.
+
+def legacy_check_pawn(position, color, white_locs, black_locs):
+    moves_list = []
+    x, y = position
+    if color == 'white':
+        if (x, y + 1) not in white_locs + black_locs and y + 1 <= 7:
+            moves_list.append((x, y + 1))
+        if y == 1 and (x, y + 2) not in white_locs + black_locs and (x, y + 1) not in white_locs + black_locs:
+            moves_list.append((x, y + 2))
+        if (x + 1, y + 1) in black_locs:
+            moves_list.append((x + 1, y + 1))
+        if (x - 1, y + 1) in black_locs:
+            moves_list.append((x - 1, y + 1))
+    else:
+        if (x, y - 1) not in white_locs + black_locs and y - 1 >= 0:
+            moves_list.append((x, y - 1))
+        if y == 6 and (x, y - 2) not in white_locs + black_locs and (x, y - 1) not in white_locs + black_locs:
+            moves_list.append((x, y - 2))
+        if (x + 1, y - 1) in white_locs:
+            moves_list.append((x + 1, y - 1))
+        if (x - 1, y - 1) in white_locs:
+            moves_list.append((x - 1, y - 1))
+    return moves_list
+
+
+def _legacy_slide(position, color, white_locs, black_locs, directions):
+    moves_list = []
+    x, y = position
+    for dx, dy in directions:
+        nx, ny = x + dx, y + dy
+        while 0 <= nx <= 7 and 0 <= ny <= 7:
+            current_pos = (nx, ny)
+            if current_pos in white_locs:
+                if color == 'black':
+                    moves_list.append(current_pos)
+                break
+            elif current_pos in black_locs:
+                if color == 'white':
+                    moves_list.append(current_pos)
+                break
+            else:
+                moves_list.append(current_pos)
+            nx += dx
+            ny += dy
+    return moves_list
+
+
+def legacy_check_rook(position, color, white_locs, black_locs):
+    return _legacy_slide(position, color, white_locs, black_locs, [(1, 0), (-1, 0), (0, 1), (0, -1)])
+
+
+def legacy_check_bishop(position, color, white_locs, black_locs):
+    return _legacy_slide(position, color, white_locs, black_locs, [(1, 1), (1, -1), (-1, 1), (-1, -1)])
+
+
+def legacy_check_queen(position, color, white_locs, black_locs):
+    return (legacy_check_rook(position, color, white_locs, black_locs) +
+            legacy_check_bishop(position, color, white_locs, black_locs))
+
+
+def _legacy_step(position, color, white_locs, black_locs, targets):
+    friends_list = white_locs if color == 'white' else black_locs
+    moves_list = []
+    for dx, dy in targets:
+        target = (position[0] + dx, position[1] + dy)
+        if 0 <= target[0] <= 7 and 0 <= target[1] <= 7 and target not in friends_list:
+            moves_list.append(target)
+    return moves_list
+
+
+def legacy_check_knight(position, color, white_locs, black_locs):
+    return _legacy_step(position, color, white_locs, black_locs,
+                        [(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)])
+
+
+def legacy_check_king_moves(position, color, white_locs, black_locs):
+    return _legacy_step(position, color, white_locs, black_locs,
+                        [(1, 0), (1, 1), (1, -1), (-1, 0), (-1, 1), (-1, -1), (0, 1), (0, -1)])
+
+
+LEGACY_GENERATORS = {
+    'pawn': legacy_check_pawn,
+    'knight': legacy_check_knight,
+    'bishop': legacy_check_bishop,
+    'rook': legacy_check_rook,
+    'queen': legacy_check_queen,
+    'king': legacy_check_king_moves,
+}
+
+
+def legacy_all_moves(state):
+    moves = []
+    for color in ('white', 'black'):
+        for piece, loc in zip(state[color + '_pieces'], state[color + '_locations']):
+            if piece is not None:
+                moves.extend(LEGACY_GENERATORS[piece](loc, color, state['white_locations'], state['black_locations']))
+    return moves
+
+
+def legacy_is_check(color, white_locs, black_locs, white_pcs, black_pcs):
+    pcs, locs = (white_pcs, white_locs) if color == 'white' else (black_pcs, black_locs)
+    if 'king' not in pcs:
+        return False
+    king_pos = locs[pcs.index('king')]
+    enemy = 'black' if color == 'white' else 'white'
+    enemy_pcs, enemy_locs = (black_pcs, black_locs) if color == 'white' else (white_pcs, white_locs)
+    for piece, pos in zip(enemy_pcs, enemy_locs):
+        if piece is not None and king_pos in LEGACY_GENERATORS[piece](pos, enemy, white_locs, black_locs):
+            return True
+    return False
+
+
+def legacy_legal_moves(state, color):
+    """Copy-and-test filtering as check_valid_moves/check_mate used to do it (castling left out)."""
+    moves = []
+    own, enemy = (color, 'black' if color == 'white' else 'white')
+    for i, piece in enumerate(state[own + '_pieces']):
+        if piece is None:
+            continue
+        for move in LEGACY_GENERATORS[piece](state[own + '_locations'][i], color,
+                                             state['white_locations'], state['black_locations']):
+            sim = copy.deepcopy(state)
+            if move in state[enemy + '_locations']:
+                captured_idx = state[enemy + '_locations'].index(move)
+                sim[enemy + '_locations'][captured_idx] = (-1, -1)
+                sim[enemy + '_pieces'][captured_idx] = None
+            sim[own + '_locations'][i] = move
+            if not legacy_is_check(color, sim['white_locations'], sim['black_locations'],
+                                   sim['white_pieces'], sim['black_pieces']):
+                moves.append(move)
+    return moves
+
+
+def engine_all_moves(state):
+    """Per-piece coordinate lists, the format the routes hand to the browser."""
+    board = engine.Position.from_state(state)
+    moves = []
+    for color in ('white', 'black'):
+        for piece, loc in zip(state[color + '_pieces'], state[color + '_locations']):
+            if piece is not None:
+                moves.extend(board.moves(piece, loc, color))
+    return moves
+
+
+def engine_native_moves(board):
+    """Encoded moves straight from the bitboards, the format the search uses."""
+    return board.generate_moves(engine.WHITE) + board.generate_moves(engine.BLACK)
+
+
+def _rate(func, arg, min_time=0.5):
+    """Calls per second of ``func(arg)`` and the size of its result."""
+    count = 0
+    result = func(arg)
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for _ in range(50):
+            func(arg)
+        count += 50
+        elapsed = time.perf_counter() - start
+    return count / elapsed, len(result)
+
+
+def bench_movegen():
+    print('Move generation (both sides, every piece)')
+    print(f"{'position':<12}{'moves':>7}{'legacy/s':>12}{'coords/s':>12}{'native/s':>12}{'speedup':>9}")
+    for name, placement in BENCH_POSITIONS.items():
+        state = load_placement(placement)
+        board = engine.Position.from_state(state)
+        native = sorted(engine.SQUARE_COORDS[engine.move_to(move)] for move in engine_native_moves(board))
+        if not sorted(legacy_all_moves(state)) == sorted(engine_all_moves(state)) == native:
+            print(f'{name}: engine and legacy move lists differ!')
+        legacy_rate, count = _rate(legacy_all_moves, state)
+        coords_rate, _ = _rate(engine_all_moves, state)
+        native_rate, _ = _rate(engine_native_moves, board)
+        print(f'{name:<12}{count:>7}{legacy_rate * count:>12,.0f}{coords_rate * count:>12,.0f}'
+              f'{native_rate * count:>12,.0f}{native_rate / legacy_rate:>8.1f}x')
+
+
+def bench_legal():
+    print('Legal move generation for white (copy-and-test vs pin/check-aware)')
+    print(f"{'position':<12}{'moves':>7}{'legacy ms':>11}{'engine ms':>11}{'speedup':>9}")
+    for name, placement in BENCH_POSITIONS.items():
+        state = load_placement(placement)
+        board = engine.Position.from_state(state)
+        legacy_rate, count = _rate(lambda s: legacy_legal_moves(s, 'white'), state)
+        engine_rate, _ = _rate(lambda b: b.legal_moves(engine.WHITE), board)
+        print(f'{name:<12}{count:>7}{1000 / legacy_rate:>11.3f}{1000 / engine_rate:>11.3f}'
+              f'{engine_rate / legacy_rate:>8.0f}x')
+
+
+def legacy_is_square_attacked(state, square, attacking_color):
+    """Generate every move of every attacker and look for the square, as is_square_attacked did."""
+    for piece, pos in zip(state[attacking_color + '_pieces'], state[attacking_color + '_locations']):
+        if piece is not None and square in LEGACY_GENERATORS[piece](pos, attacking_color,
+                                                                    state['white_locations'], state['black_locations']):
+            return True
+    return False
+
+
+def bench_attacks():
+    print('Attacked-square queries by black, averaged over all 64 squares')
+    print(f"{'position':<12}{'legacy us':>11}{'map us':>9}{'lookup us':>11}{'speedup':>9}")
+    for name, placement in BENCH_POSITIONS.items():
+        state = load_placement(placement)
+        board = engine.Position.from_state(state)
+        squares = [engine.coords(sq) for sq in range(64)]
+        # The old generators skip pushes onto and "captures" of their own pieces,
+        # so the answers only agree on squares holding a white piece (the king's case)
+        for x, y in squares:
+            expected = board.is_square_attacked(engine.square(x, y), engine.BLACK)
+            if board.piece_at(x, y) is not None and board.piece_at(x, y)[0] == 'white' and \
+                    legacy_is_square_attacked(state, (x, y), 'black') != expected:
+                print(f'{name}: attack lookup disagrees on {(x, y)}')
+        legacy_rate, _ = _rate(lambda s: [legacy_is_square_attacked(s, sq, 'black') for sq in squares], state)
+        map_rate, _ = _rate(lambda b: [b.attacks_by(engine.BLACK) >> sq & 1 for sq in range(64)], board)
+        lookup_rate, _ = _rate(lambda b: [b.is_square_attacked(sq, engine.BLACK) for sq in range(64)], board)
+        per_query = 1e6 / 64
+        print(f'{name:<12}{per_query / legacy_rate:>11.2f}{per_query / map_rate:>9.2f}'
+              f'{per_query / lookup_rate:>11.2f}{lookup_rate / legacy_rate:>8.0f}x')
+
+
+class RootOptionsAI(ChessAI):
+    """ChessAI searching the root's option lists at every node, as it did when
+    child states inherited white_options/black_options from the root.
+
+    Each piece keeps "moving" to its root targets from wherever it now stands,
+    which is the phantom-line behaviour the per-node generator replaced.
+    """
+
+    def __init__(self, root_board, audit=False):
+        super().__init__('hard')
+        # With audit set, count the moves handed to the search and how many of
+        # them the board does not allow (kept out of timed runs)
+        self.audit = audit
+        self.replayed = 0
+        self.phantom = 0
+        self.root_targets = {}
+        for c in (engine.WHITE, engine.BLACK):
+            for move in root_board.generate_moves(c):
+                slot = root_board.slots[engine.move_from(move)]
+                self.root_targets.setdefault((c, slot), []).append(engine.move_to(move))
+
+    def search_moves(self, board, c, captures=False):
+        own = board.occupied[c]
+        moves = []
+        for sq in engine.iter_bits(own):
+            is_king = engine.code_piece(board.squares[sq]) == engine.KING
+            for to_sq in self.root_targets.get((c, board.slots[sq]), ()):
+                if own >> to_sq & 1 or (captures and not board.squares[to_sq]):
+                    continue
+                if is_king and abs(to_sq - sq) == 2:
+                    continue  # would be taken for a castling move
+                moves.append(board.move_code(sq, to_sq))
+        if self.audit:
+            real = set(ChessAI.search_moves(self, board, c, captures))
+            self.replayed += len(moves)
+            self.phantom += sum(1 for move in moves if move not in real)
+        return moves
+
+
+def _time_to_depth(ai, board, depth):
+    """Nodes and seconds for iterative deepening to ``depth`` with black to move."""
+    start = time.perf_counter()
+    for d in range(1, depth + 1):
+        ai.minimax(board, d, float('-inf'), float('inf'), True)
+    return ai.nodes, time.perf_counter() - start
+
+
+def bench_search(depth=3):
+    print(f'Search to depth {depth} for black, root options replayed vs moves generated per node')
+    print(f"{'position':<12}{'old nodes':>11}{'phantom':>9}{'old s':>8}{'new nodes':>11}{'new s':>8}{'new n/s':>10}")
+    for name, placement in BENCH_POSITIONS.items():
+        state = load_placement(placement)
+        state['turn_step'] = 1
+        board = engine.Position.from_state(state)
+        old_nodes, old_time = _time_to_depth(RootOptionsAI(board), board.copy(), depth)
+        new_nodes, new_time = _time_to_depth(ChessAI('hard'), board.copy(), depth)
+        audit = RootOptionsAI(board, audit=True)
+        _time_to_depth(audit, board.copy(), depth)
+        phantom = audit.phantom / audit.replayed if audit.replayed else 0.0
+        print(f'{name:<12}{old_nodes:>11,}{phantom:>9.0%}{old_time:>8.2f}{new_nodes:>11,}{new_time:>8.2f}'
+              f'{new_nodes / new_time:>10,.0f}')
+
+
+def _full_window_root(ai, board, moves, depth):
+    """The root loop before PVS: static order, every move searched with a full window."""
+    best_move, best_score = None, float('-inf')
+    for d in range(1, depth + 1):
+        best_move, best_score = None, float('-inf')
+        for move in moves:
+            undo = board.make_move(move)
+            score = ai.minimax(board, d, float('-inf'), float('inf'), False)
+            board.unmake_move(undo)
+            if score > best_score:
+                best_move, best_score = move, score
+    return best_move, best_score
+
+
+def _pvs_root(ai, board, moves, depth):
+    for d in range(1, depth + 1):
+        score, moves, ai.pv = ai._search_root(board, moves, d)
+    return moves[0], score
+
+
+def bench_root(depth=3):
+    print(f'Hard-mode iterative deepening to depth {depth}, full-window root vs PVS with re-ranking')
+    print(f"{'position':<12}{'old nodes':>11}{'old s':>8}{'new nodes':>11}{'new s':>8}  {'best':<14}{'score':>7}")
+    for name, placement in BENCH_POSITIONS.items():
+        state = load_placement(placement)
+        state['turn_step'] = 1
+        board = engine.Position.from_state(state)
+        board.set_side(engine.BLACK)
+        results = []
+        for search in (_full_window_root, _pvs_root):
+            ai = ChessAI('hard')
+            moves = ai.order_moves(board, board.legal_moves(engine.BLACK), engine.BLACK)
+            start = time.perf_counter()
+            best, score = search(ai, board, moves, depth)
+            results.append((ai.nodes, time.perf_counter() - start))
+        (old_nodes, old_time), (new_nodes, new_time) = results
+        best = '{}-{}'.format(*(engine.SQUARE_COORDS[sq] for sq in (engine.move_from(best), engine.move_to(best))))
+        print(f'{name:<12}{old_nodes:>11,}{old_time:>8.2f}{new_nodes:>11,}{new_time:>8.2f}  {best:<14}{score:>7}')
+
+
+class UnorderedQuietAI(ChessAI):
+    """ChessAI that never records killers or history, so quiet moves fall back to center distance."""
+
+    def _record_quiet_cutoff(self, move, c, ply, depth):
+        pass
+
+
+def bench_ordering(depth=3):
+    print(f'PVS to depth {depth}, quiet moves by center distance vs killers and history')
+    print(f"{'position':<12}{'old nodes':>11}{'old 1st':>9}{'new nodes':>11}{'new 1st':>9}{'nodes':>8}")
+    for name, placement in BENCH_POSITIONS.items():
+        state = load_placement(placement)
+        state['turn_step'] = 1
+        board = engine.Position.from_state(state)
+        board.set_side(engine.BLACK)
+        results = []
+        for ai in (UnorderedQuietAI('hard'), ChessAI('hard')):
+            moves = ai.order_moves(board, board.legal_moves(engine.BLACK), engine.BLACK)
+            _pvs_root(ai, board, moves, depth)
+            results.append((ai.nodes, ai.first_move_cutoffs / ai.cutoffs if ai.cutoffs else 0.0))
+        (old_nodes, old_rate), (new_nodes, new_rate) = results
+        print(f'{name:<12}{old_nodes:>11,}{old_rate:>9.1%}{new_nodes:>11,}{new_rate:>9.1%}'
+              f'{new_nodes / old_nodes - 1:>+8.0%}')
+
+
+def _depth_in_budget(ai, board, moves, seconds):
+    """Deepest PVS iteration completed within ``seconds``."""
+    ai.search_deadline = Deadline(seconds)
+    depth = 0
+    try:
+        for d in range(1, 64):
+            _, moves, ai.pv = ai._search_root(board, moves, d)
+            depth = d
+    except SearchCancelled:
+        pass
+    return depth
+
+
+def bench_pruning(depth=3, seconds=3.0):
+    print(f'Nodes to depth {depth} and depth reached in {seconds:g}s, without vs with null move and LMR')
+    print(f"{'position':<12}{'old nodes':>11}{'new nodes':>11}{'old depth':>11}{'new depth':>11}"
+          f"{'null cuts':>11}{'reduced':>9}{'re-search':>11}")
+    for name, placement in BENCH_POSITIONS.items():
+        state = load_placement(placement)
+        state['turn_step'] = 1
+        board = engine.Position.from_state(state)
+        board.set_side(engine.BLACK)
+        results = []
+        for pruning in (False, True):
+            ai = ChessAI('hard')
+            ai.null_move_pruning = ai.late_move_reductions = pruning
+            moves = ai.order_moves(board, board.legal_moves(engine.BLACK), engine.BLACK)
+            _pvs_root(ai, board, moves, depth)
+            nodes = ai.nodes
+            ai = ChessAI('hard')
+            ai.null_move_pruning = ai.late_move_reductions = pruning
+            # A cancelled search leaves its moves on the board, so give it a copy
+            reached = _depth_in_budget(ai, board.copy(), moves, seconds)
+            results.append((nodes, reached, ai))
+        (old_nodes, old_depth, _), (new_nodes, new_depth, ai) = results
+        print(f'{name:<12}{old_nodes:>11,}{new_nodes:>11,}{old_depth:>11}{new_depth:>11}'
+              f'{ai.null_move_cutoffs:>11,}{ai.reductions:>9,}{ai.reduction_researches:>11,}')
+
+
+def bench_aspiration(depth=4):
+    print(f'Iterative deepening to depth {depth}, full window vs aspiration windows')
+    print(f"{'position':<12}{'old nodes':>11}{'new nodes':>11}{'nodes':>8}{'windows':>9}{'fail low':>10}{'fail high':>11}")
+    for name, placement in BENCH_POSITIONS.items():
+        state = load_placement(placement)
+        state['turn_step'] = 1
+        board = engine.Position.from_state(state)
+        board.set_side(engine.BLACK)
+        results = []
+        for aspiration in (False, True):
+            ai = ChessAI('hard')
+            moves = ai.order_moves(board, board.legal_moves(engine.BLACK), engine.BLACK)
+            score = None
+            for d in range(1, depth + 1):
+                if aspiration:
+                    score, moves, ai.pv = ai._aspiration_search(board, moves, d, score)
+                else:
+                    score, moves, ai.pv = ai._search_root(board, moves, d)
+            results.append(ai.search_stats())
+        old, new = results
+        print(f"{name:<12}{old['nodes']:>11,}{new['nodes']:>11,}{new['nodes'] / old['nodes'] - 1:>+8.0%}"
+              f"{new['aspiration_searches']:>9}{new['aspiration_fail_low']:>10}{new['aspiration_fail_high']:>11}")
+
+
+class ScanningEvalAI(ChessAI):
+    """ChessAI that sums material and piece-square tables over every piece at each leaf."""
+
+    def _attach_tables(self, board):
+        pass
+
+
+def bench_eval(depth=3):
+    print(f'Leaf evaluation, and search to depth {depth}: full material/PST scan vs running sums')
+    print(f"{'position':<12}{'old evals/s':>13}{'new evals/s':>13}{'speedup':>9}{'old n/s':>10}{'new n/s':>10}")
+    for name, placement in BENCH_POSITIONS.items():
+        state = load_placement(placement)
+        state['turn_step'] = 1
+        board = engine.Position.from_state(state)
+        board.set_side(engine.BLACK)
+        rates = []
+        for ai in (ScanningEvalAI('hard'), ChessAI('hard')):
+            leaf = board.copy()
+            ai._attach_tables(leaf)
+            rate, _ = _rate(lambda b: [ai.evaluate_board_hard(b)], leaf)
+            moves = ai.order_moves(board, board.legal_moves(engine.BLACK), engine.BLACK)
+            start = time.perf_counter()
+            _pvs_root(ai, board.copy(), moves, depth)
+            rates.append((rate, ai.nodes / (time.perf_counter() - start)))
+        (old_rate, old_nps), (new_rate, new_nps) = rates
+        print(f'{name:<12}{old_rate:>13,.0f}{new_rate:>13,.0f}{new_rate / old_rate:>8.1f}x'
+              f'{old_nps:>10,.0f}{new_nps:>10,.0f}')
+
+
+class MissingPawnHash(PawnHashTable):
+    """Pawn hash that never finds an entry, so every leaf scores its pawns from scratch."""
+
+    def probe(self, key):
+        self.misses += 1
+        return None
+
+
+class NoPawnHashAI(ChessAI):
+    def __init__(self, difficulty='medium'):
+        super().__init__(difficulty)
+        self.pawn_hash = MissingPawnHash(self.pawn_hash_size_kb)
+
+
+def bench_pawns(depth=3):
+    print(f'Leaf evaluation, and search to depth {depth}: pawn structure from scratch vs pawn hash')
+    print(f"{'position':<12}{'old evals/s':>13}{'new evals/s':>13}{'speedup':>9}{'old n/s':>10}{'new n/s':>10}"
+          f"{'hit rate':>10}")
+    for name, placement in BENCH_POSITIONS.items():
+        state = load_placement(placement)
+        state['turn_step'] = 1
+        board = engine.Position.from_state(state)
+        board.set_side(engine.BLACK)
+        rates = []
+        for ai in (NoPawnHashAI('hard'), ChessAI('hard')):
+            leaf = board.copy()
+            ai._attach_tables(leaf)
+            rate, _ = _rate(lambda b: [ai.evaluate_board_hard(b)], leaf)
+            ai.pawn_hash.clear()
+            moves = ai.order_moves(board, board.legal_moves(engine.BLACK), engine.BLACK)
+            start = time.perf_counter()
+            _pvs_root(ai, board.copy(), moves, depth)
+            rates.append((rate, ai.nodes / (time.perf_counter() - start), ai.search_stats()))
+        (old_rate, old_nps, _), (new_rate, new_nps, stats) = rates
+        probes = stats['pawn_hash_hits'] + stats['pawn_hash_misses']
+        print(f'{name:<12}{old_rate:>13,.0f}{new_rate:>13,.0f}{new_rate / old_rate:>8.1f}x'
+              f'{old_nps:>10,.0f}{new_nps:>10,.0f}{stats["pawn_hash_hits"] / probes if probes else 0:>10.1%}')
+
+
+class MissingEvalCache(EvalCache):
+    """Eval cache that never finds an entry, so every leaf is evaluated."""
+
+    def probe(self, key):
+        self.misses += 1
+        return None
+
+
+class NoEvalCacheAI(ChessAI):
+    def __init__(self, difficulty='medium'):
+        super().__init__(difficulty)
+        self.eval_cache = MissingEvalCache(self.eval_cache_size_kb)
+
+
+def bench_eval_cache(depth=4):
+    print(f'Search to depth {depth}: every leaf evaluated vs eval cache')
+    print(f"{'position':<12}{'nodes':>9}{'old s':>8}{'new s':>8}{'speedup':>9}{'evals':>9}{'hits':>9}{'hit rate':>10}")
+    for name, placement in BENCH_POSITIONS.items():
+        state = load_placement(placement)
+        state['turn_step'] = 1
+        board = engine.Position.from_state(state)
+        board.set_side(engine.BLACK)
+        results = []
+        for ai in (NoEvalCacheAI('hard'), ChessAI('hard')):
+            moves = ai.order_moves(board, board.legal_moves(engine.BLACK), engine.BLACK)
+            start = time.perf_counter()
+            _pvs_root(ai, board.copy(), moves, depth)
+            results.append((time.perf_counter() - start, ai.search_stats()))
+        (old_time, _), (new_time, stats) = results
+        hits, probes = stats['eval_cache_hits'], stats['eval_cache_hits'] + stats['eval_cache_misses']
+        print(f"{name:<12}{stats['nodes']:>9,}{old_time:>8.2f}{new_time:>8.2f}{old_time / new_time:>8.2f}x"
+              f"{probes:>9,}{hits:>9,}{hits / probes if probes else 0:>10.1%}")
+
+
+class VictimOrderAI(ChessAI):
+    """ChessAI ranking captures by victim and aggressor value alone, none pruned in quiescence."""
+
+    def see(self, board, move):
+        return (self.type_values[(board.squares[engine.move_to(move)] & 7) - 1] -
+                self.type_values[(board.squares[engine.move_from(move)] & 7) - 1] / 100)
+
+
+def bench_see(depth=4):
+    print(f'Search to depth {depth}: captures by victim/aggressor vs static exchange evaluation')
+    print(f"{'position':<12}{'old nodes':>11}{'old s':>8}{'new nodes':>11}{'new s':>8}{'nodes':>8}{'pruned':>9}")
+    for name, placement in BENCH_POSITIONS.items():
+        state = load_placement(placement)
+        state['turn_step'] = 1
+        board = engine.Position.from_state(state)
+        board.set_side(engine.BLACK)
+        results = []
+        for ai in (VictimOrderAI('hard'), ChessAI('hard')):
+            moves = ai.order_moves(board, board.legal_moves(engine.BLACK), engine.BLACK)
+            start = time.perf_counter()
+            _pvs_root(ai, board.copy(), moves, depth)
+            results.append((time.perf_counter() - start, ai.search_stats()))
+        (old_time, old), (new_time, new) = results
+        print(f"{name:<12}{old['nodes']:>11,}{old_time:>8.2f}{new['nodes']:>11,}{new_time:>8.2f}"
+              f"{new['nodes'] / old['nodes'] - 1:>+8.0%}{new['see_pruned']:>9,}")
+
+
+class SortedMovesAI(ChessAI):
+    """ChessAI generating and sorting every move at a node before searching the first."""
+
+    def staged_moves(self, board, c, hash_move=None, pv_move=None, ply=None):
+        return self.order_moves(board, self.search_moves(board, c), c, hash_move, pv_move, ply)
+
+
+def bench_staged(depth=5):
+    print(f'Search to depth {depth}: every move generated and sorted vs a staged move picker')
+    print(f"{'position':<12}{'old nodes':>11}{'old s':>8}{'new nodes':>11}{'new s':>8}{'time':>8}"
+          f"{'old score':>11}{'new score':>11}")
+    for name, placement in BENCH_POSITIONS.items():
+        state = load_placement(placement)
+        state['turn_step'] = 1
+        board = engine.Position.from_state(state)
+        board.set_side(engine.BLACK)
+        results = []
+        for ai in (SortedMovesAI('hard'), ChessAI('hard')):
+            moves = ai.order_moves(board, board.legal_moves(engine.BLACK), engine.BLACK)
+            start = time.perf_counter()
+            _, score = _pvs_root(ai, board.copy(), moves, depth)
+            results.append((time.perf_counter() - start, ai.nodes, score))
+        (old_time, old_nodes, old_score), (new_time, new_nodes, new_score) = results
+        print(f"{name:<12}{old_nodes:>11,}{old_time:>8.2f}{new_nodes:>11,}{new_time:>8.2f}"
+              f"{new_time / old_time - 1:>+8.0%}{old_score:>11}{new_score:>11}")
+
+
+def bench_frontier(depth=4, seconds=3.0):
+    print(f'Nodes to depth {depth} and depth reached in {seconds:g}s, without vs with '
+          f'futility, razoring and delta pruning')
+    print(f"{'position':<12}{'old nodes':>11}{'new nodes':>11}{'nodes':>8}{'old depth':>11}{'new depth':>11}"
+          f"{'futility':>10}{'razor':>8}{'delta':>8}")
+    for name, placement in BENCH_POSITIONS.items():
+        state = load_placement(placement)
+        state['turn_step'] = 1
+        board = engine.Position.from_state(state)
+        board.set_side(engine.BLACK)
+        results = []
+        for pruning in (False, True):
+            ai = ChessAI('hard')
+            ai.futility_pruning = ai.razoring = ai.delta_pruning = pruning
+            moves = ai.order_moves(board, board.legal_moves(engine.BLACK), engine.BLACK)
+            _pvs_root(ai, board, moves, depth)
+            stats = ai.search_stats()
+            ai = ChessAI('hard')
+            ai.futility_pruning = ai.razoring = ai.delta_pruning = pruning
+            reached = _depth_in_budget(ai, board.copy(), moves, seconds)
+            results.append((stats, reached))
+        (old, old_depth), (new, new_depth) = results
+        print(f"{name:<12}{old['nodes']:>11,}{new['nodes']:>11,}{new['nodes'] / old['nodes'] - 1:>+8.0%}"
+              f"{old_depth:>11}{new_depth:>11}{new['futility_pruned']:>10,}{new['razor_cutoffs']:>8,}"
+              f"{new['delta_pruned']:>8,}")
+
+
+def _smp_time_to_depth(workers, mode, board, depth):
+    """Seconds, total nodes and score for a ``workers``-process search to ``depth``."""
+    ai = ChessAI('hard')
+    ai.smp_workers = workers
+    ai.smp_mode = mode
+    ai._new_search()
+    moves = ai.order_moves(board, board.legal_moves(engine.BLACK), engine.BLACK)
+    ai.search_deadline = Deadline(600)
+    start = time.perf_counter()
+    _, score, _ = ai._search(board, moves, range(1, depth + 1))
+    return time.perf_counter() - start, ai.nodes + ai.helper_nodes, score
+
+
+def bench_smp(depth=6, worker_counts=(1, 2, 4)):
+    print(f'Time to depth {depth} by worker count, Lazy SMP and root split (1 = single process)')
+    header = ''.join(f"{f'{n}w s':>9}{f'{n}w nodes':>12}{f'{n}w score':>10}" for n in worker_counts)
+    print(f"{'position':<12}{'mode':<6}{header}")
+    # Start the helper pool before timing anything
+    _smp_time_to_depth(max(worker_counts), 'lazy',
+                       engine.Position.from_state(load_placement(BENCH_POSITIONS['start'])), 1)
+    for name, placement in BENCH_POSITIONS.items():
+        state = load_placement(placement)
+        state['turn_step'] = 1
+        board = engine.Position.from_state(state)
+        board.set_side(engine.BLACK)
+        for mode in ('lazy', 'root'):
+            row = ''
+            for workers in worker_counts:
+                seconds, nodes, score = _smp_time_to_depth(workers, mode, board.copy(), depth)
+                row += f'{seconds:>9.2f}{nodes:>12,}{score:>10}'
+            print(f'{name:<12}{mode:<6}{row}')
+
+
+BENCHMARKS = {
+    'movegen': bench_movegen,
+    'legal': bench_legal,
+    'attacks': bench_attacks,
+    'search': bench_search,
+    'root': bench_root,
+    'ordering': bench_ordering,
+    'pruning': bench_pruning,
+    'aspiration': bench_aspiration,
+    'eval': bench_eval,
+    'pawns': bench_pawns,
+    'evalcache': bench_eval_cache,
+    'see': bench_see,
+    'frontier': bench_frontier,
+    'staged': bench_staged,
+    'smp': bench_smp,
+}
+
+
+if __name__ == '__main__':
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for bench_name in selected:
+        BENCHMARKS[bench_name]()
+        print()
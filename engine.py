@@ -0,0 +1,997 @@
+"""Bitboard move generation shared by the Flask routes and ChessAI.
+
+Squares are numbered ``y * 8 + x``, so bit ``n`` of a bitboard is the board
+coordinate ``(n % 8, n // 8)`` used by the session state. White starts on
+ranks 0-1 and moves up the board, black starts on ranks 6-7 and moves down.
+"""
+import random
+
+COLORS = ('white', 'black')
+WHITE, BLACK = 0, 1
+
+PIECE_TYPES = ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king')
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_INDEX = {name: i for i, name in enumerate(PIECE_TYPES)}
+
+FULL_BOARD = (1 << 64) - 1
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+NOT_FILE_A = FULL_BOARD ^ FILE_A
+NOT_FILE_H = FULL_BOARD ^ FILE_H
+RANK_MASKS = [0xFF << (8 * y) for y in range(8)]
+
+
+def square(x, y):
+    return y * 8 + x
+
+
+def coords(sq):
+    return (sq % 8, sq // 8)
+
+
+def _on_board(x, y):
+    return 0 <= x <= 7 and 0 <= y <= 7
+
+
+def _step_table(offsets):
+    table = []
+    for sq in range(64):
+        x, y = coords(sq)
+        bb = 0
+        for dx, dy in offsets:
+            if _on_board(x + dx, y + dy):
+                bb |= 1 << square(x + dx, y + dy)
+        table.append(bb)
+    return table
+
+
+# Precomputed attack masks for the non-sliding pieces
+KNIGHT_ATTACKS = _step_table([(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)])
+KING_ATTACKS = _step_table([(1, 0), (1, 1), (1, -1), (-1, 0), (-1, 1), (-1, -1), (0, 1), (0, -1)])
+PAWN_ATTACKS = (
+    _step_table([(1, 1), (-1, 1)]),    # white captures up the board
+    _step_table([(1, -1), (-1, -1)]),  # black captures down the board
+)
+
+# Sliding directions. Rays in the first four grow towards higher square
+# numbers, so their nearest blocker is the lowest set bit; the last four
+# shrink and their nearest blocker is the highest set bit.
+ROOK_DIRECTIONS = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+BISHOP_DIRECTIONS = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
+DIRECTIONS = [(0, 1), (1, 0), (1, 1), (-1, 1), (0, -1), (-1, 0), (1, -1), (-1, -1)]
+POSITIVE_DIRECTIONS = DIRECTIONS[:4]
+
+
+def _ray_table(dx, dy):
+    table = []
+    for sq in range(64):
+        x, y = coords(sq)
+        bb = 0
+        nx, ny = x + dx, y + dy
+        while _on_board(nx, ny):
+            bb |= 1 << square(nx, ny)
+            nx += dx
+            ny += dy
+        table.append(bb)
+    return table
+
+
+RAYS = {d: _ray_table(*d) for d in DIRECTIONS}
+
+
+def _between_table():
+    # BETWEEN[a][b]: squares strictly between two squares on a shared line, else 0
+    table = [[0] * 64 for _ in range(64)]
+    for a in range(64):
+        for d in DIRECTIONS:
+            between = 0
+            x, y = coords(a)
+            x, y = x + d[0], y + d[1]
+            while _on_board(x, y):
+                b = square(x, y)
+                table[a][b] = between
+                between |= 1 << b
+                x, y = x + d[0], y + d[1]
+    return table
+
+
+BETWEEN = _between_table()
+
+# Castling in this layout: the king starts on file 3 and castles two squares
+# towards either corner; the rook lands on the square the king crossed. The
+# two squares next to the king must be empty and unattacked.
+CASTLE_KINGSIDE, CASTLE_QUEENSIDE = 1, 2
+CASTLING_PATHS = {
+    # (color, side): (king_from, king_to, rook_from, rook_to, path)
+    (WHITE, CASTLE_KINGSIDE): (3, 5, 7, 4, (1 << 4) | (1 << 5)),
+    (WHITE, CASTLE_QUEENSIDE): (3, 1, 0, 2, (1 << 1) | (1 << 2)),
+    (BLACK, CASTLE_KINGSIDE): (59, 61, 63, 60, (1 << 60) | (1 << 61)),
+    (BLACK, CASTLE_QUEENSIDE): (59, 57, 56, 58, (1 << 57) | (1 << 58)),
+}
+
+
+def castle_right(c, side):
+    """Bit for one castling right: white kingside 1, white queenside 2, black 4 and 8."""
+    return side << (2 * c)
+
+
+def _castling_keep():
+    # Rights that survive a move touching each square (as origin or capture target)
+    keep = [0b1111] * 64
+    for (c, side), (king_from, _, rook_from, _, _) in CASTLING_PATHS.items():
+        keep[king_from] &= ~castle_right(c, side)
+        keep[rook_from] &= ~castle_right(c, side)
+    return keep
+
+
+CASTLING_KEEP = _castling_keep()
+# Castling king destination -> (rook_from, rook_to)
+CASTLING_ROOKS = {king_to: (rook_from, rook_to)
+                  for king_from, king_to, rook_from, rook_to, _ in CASTLING_PATHS.values()}
+
+
+def _zobrist_tables():
+    # A fixed seed keeps keys identical across processes and server restarts
+    rng = random.Random(0x2F0B1257)
+    pieces = [[0] * 64 for _ in range(16)]
+    for c in (WHITE, BLACK):
+        for ptype in range(6):
+            pieces[(c << 3) | (ptype + 1)] = [rng.getrandbits(64) for _ in range(64)]
+    castling = [rng.getrandbits(64) for _ in range(16)]
+    return pieces, castling, rng.getrandbits(64)
+
+
+# 64-bit keys per (piece code, square), per castling-rights mask, and for black to move
+ZOBRIST_PIECES, ZOBRIST_CASTLING, ZOBRIST_SIDE = _zobrist_tables()
+
+
+def _pawn_masks():
+    # Squares that must hold no enemy pawn for a pawn to count as passed
+    passed = ([0] * 64, [0] * 64)
+    for sq in range(64):
+        x, y = coords(sq)
+        files = 0
+        for fx in (x - 1, x, x + 1):
+            if 0 <= fx <= 7:
+                files |= FILE_A << fx
+        passed[WHITE][sq] = files & sum(RANK_MASKS[r] for r in range(y + 1, 8))
+        passed[BLACK][sq] = files & sum(RANK_MASKS[r] for r in range(0, y))
+    return passed
+
+
+PASSED_PAWN_MASKS = _pawn_masks()
+FILE_MASKS = [FILE_A << x for x in range(8)]
+# Same-rank neighbours, used for the connected pawn bonus
+NEIGHBOUR_MASKS = [((1 << (sq - 1)) if sq % 8 > 0 else 0) | ((1 << (sq + 1)) if sq % 8 < 7 else 0)
+                   for sq in range(64)]
+# Squares within two king steps, used for king safety
+KING_ZONES = [sum(1 << square(x, y) for x in range(8) for y in range(8)
+                  if max(abs(x - coords(sq)[0]), abs(y - coords(sq)[1])) <= 2)
+              for sq in range(64)]
+CENTER_INNER = sum(1 << square(x, y) for x in (3, 4) for y in (3, 4))
+CENTER_OUTER = sum(1 << square(x, y) for x in range(2, 6) for y in range(2, 6)) & ~CENTER_INNER
+
+
+def lsb(bb):
+    """Index of the lowest set bit."""
+    return (bb & -bb).bit_length() - 1
+
+
+def msb(bb):
+    """Index of the highest set bit."""
+    return bb.bit_length() - 1
+
+
+def iter_bits(bb):
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+def popcount(bb):
+    return bin(bb).count('1')
+
+
+def ray_attacks(sq, occupied, direction):
+    """Squares reached along one ray, stopping at (and including) the first blocker."""
+    ray = RAYS[direction]
+    attacks = ray[sq]
+    blockers = attacks & occupied
+    if blockers:
+        if direction in POSITIVE_DIRECTIONS:
+            attacks ^= ray[lsb(blockers)]
+        else:
+            attacks ^= ray[msb(blockers)]
+    return attacks
+
+
+def _relevant_mask(sq, directions):
+    # Edge squares never block anything further along the ray, so they are
+    # left out of the occupancy key.
+    mask = 0
+    for d in directions:
+        ray = RAYS[d][sq]
+        blockers = ray
+        dx, dy = d
+        x, y = coords(sq)
+        while _on_board(x + dx, y + dy):
+            x += dx
+            y += dy
+        if (x, y) != coords(sq):
+            blockers &= ~(1 << square(x, y))
+        mask |= blockers
+    return mask
+
+
+ROOK_MASKS = [_relevant_mask(sq, ROOK_DIRECTIONS) for sq in range(64)]
+BISHOP_MASKS = [_relevant_mask(sq, BISHOP_DIRECTIONS) for sq in range(64)]
+
+# Slider attacks keyed by the relevant occupancy of each square. The tables
+# fill lazily: every key is one of at most 4096 blocker subsets per square,
+# so after warm-up each lookup is a single dict hit.
+_ROOK_TABLE = [{} for _ in range(64)]
+_BISHOP_TABLE = [{} for _ in range(64)]
+
+
+def rook_attacks(sq, occupied):
+    key = occupied & ROOK_MASKS[sq]
+    table = _ROOK_TABLE[sq]
+    attacks = table.get(key)
+    if attacks is None:
+        attacks = 0
+        for d in ROOK_DIRECTIONS:
+            attacks |= ray_attacks(sq, key, d)
+        table[key] = attacks
+    return attacks
+
+
+def bishop_attacks(sq, occupied):
+    key = occupied & BISHOP_MASKS[sq]
+    table = _BISHOP_TABLE[sq]
+    attacks = table.get(key)
+    if attacks is None:
+        attacks = 0
+        for d in BISHOP_DIRECTIONS:
+            attacks |= ray_attacks(sq, key, d)
+        table[key] = attacks
+    return attacks
+
+
+def queen_attacks(sq, occupied):
+    return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+
+
+def piece_attacks(piece, sq, color, occupied):
+    """Squares attacked by a piece (pawns only attack diagonally)."""
+    if piece == PAWN:
+        return PAWN_ATTACKS[color][sq]
+    if piece == KNIGHT:
+        return KNIGHT_ATTACKS[sq]
+    if piece == BISHOP:
+        return bishop_attacks(sq, occupied)
+    if piece == ROOK:
+        return rook_attacks(sq, occupied)
+    if piece == QUEEN:
+        return queen_attacks(sq, occupied)
+    return KING_ATTACKS[sq]
+
+
+def pawn_pushes(sq, color, occupied):
+    empty = ~occupied & FULL_BOARD
+    if color == WHITE:
+        if sq >= 56:
+            return 0
+        single = (1 << (sq + 8)) & empty
+        if single and 8 <= sq < 16:
+            return single | ((1 << (sq + 16)) & empty)
+        return single
+    if sq < 8:
+        return 0
+    single = (1 << (sq - 8)) & empty
+    if single and 48 <= sq < 56:
+        return single | ((1 << (sq - 16)) & empty)
+    return single
+
+
+def piece_targets(piece, sq, color, own, enemy):
+    """Pseudo-legal destination squares for one piece (castling excluded)."""
+    if piece == PAWN:
+        return pawn_pushes(sq, color, own | enemy) | (PAWN_ATTACKS[color][sq] & enemy)
+    return piece_attacks(piece, sq, color, own | enemy) & ~own
+
+
+def occupancy(locations):
+    """Bitboard of the on-board squares in a session location list."""
+    bb = 0
+    for x, y in locations:
+        if 0 <= x <= 7 and 0 <= y <= 7:
+            bb |= 1 << (y * 8 + x)
+    return bb
+
+
+SQUARE_COORDS = [coords(sq) for sq in range(64)]
+
+
+def to_coords(bb):
+    moves = []
+    while bb:
+        low = bb & -bb
+        moves.append(SQUARE_COORDS[low.bit_length() - 1])
+        bb ^= low
+    return moves
+
+
+def color_index(color):
+    return WHITE if color == 'white' else BLACK
+
+
+def moves_from(piece_name, position, color, white_locations, black_locations):
+    """Coordinate move list for one piece, matching the app's check_* helpers."""
+    c = color_index(color)
+    white_occ = occupancy(white_locations)
+    black_occ = occupancy(black_locations)
+    own, enemy = (white_occ, black_occ) if c == WHITE else (black_occ, white_occ)
+    sq = square(*position)
+    return to_coords(piece_targets(PIECE_INDEX[piece_name], sq, c, own, enemy))
+
+
+def piece_code(c, piece):
+    """Mailbox code for a piece: 1-6 for white, 9-14 for black, 0 for empty."""
+    return (c << 3) | (piece + 1)
+
+
+def code_color(code):
+    return code >> 3
+
+
+def code_piece(code):
+    return (code & 7) - 1
+
+
+# Moves are 16-bit integers: the destination square in bits 0-5, the origin
+# in bits 6-11 and flags above, so a move list fits an array('H') and the
+# low 12 bits index from/to tables directly. Pawns always promote to a queen
+# in this game, so one flag covers promotion. 0 is never a move.
+MOVE_CAPTURE = 1 << 12
+MOVE_CASTLE = 1 << 13
+MOVE_PROMOTION = 1 << 14
+MOVE_SQUARES = 0xFFF
+
+
+def move_from(move):
+    return move >> 6 & 63
+
+
+def move_to(move):
+    return move & 63
+
+
+class Position:
+    """Bitboards plus a 64-square mailbox, built from the session piece/location lists.
+
+    ``squares`` holds the piece code on each square and ``slots`` the index of
+    that piece in its side's session lists, so "what is on this square" and
+    "which list entry is it" are both single lookups. ``key`` is the Zobrist
+    hash of the position, kept up to date by every method that changes it;
+    ``pawn_key`` hashes the pawns alone, for caching pawn-structure terms.
+
+    Once set_piece_square_tables has attached a pair of midgame/endgame
+    tables, ``psq_mg`` and ``psq_eg`` hold their sums over every piece and
+    are kept up to date the same way.
+
+    ``kings`` caches each side's king square (None once captured),
+    ``counts`` the number of pieces per piece code and ``piece_count``
+    their total. Fields are fixed by ``__slots__``, so a board carries no
+    per-instance dict.
+    """
+
+    __slots__ = ('occupied', 'pieces', 'squares', 'slots', 'list_sizes', 'castling', 'side',
+                 'kings', 'counts', 'piece_count', 'key', 'pawn_key', 'history',
+                 'psq_tables', 'psq_mg', 'psq_eg')
+
+    def __init__(self, white_pieces, white_locations, black_pieces, black_locations):
+        self.occupied = [0, 0]
+        self.pieces = [[0] * 6, [0] * 6]
+        self.squares = bytearray(64)
+        self.slots = bytearray(64)
+        self.list_sizes = [len(white_pieces), len(black_pieces)]
+        self.castling = 0
+        self.side = WHITE
+        self.kings = [None, None]
+        self.counts = bytearray(16)
+        for c, pieces, locations in ((WHITE, white_pieces, white_locations),
+                                     (BLACK, black_pieces, black_locations)):
+            for i, (piece, loc) in enumerate(zip(pieces, locations)):
+                if piece is None or not _on_board(*loc):
+                    continue
+                sq = square(*loc)
+                ptype = PIECE_INDEX[piece]
+                self.occupied[c] |= 1 << sq
+                self.pieces[c][ptype] |= 1 << sq
+                self.squares[sq] = piece_code(c, ptype)
+                self.slots[sq] = i
+                self.counts[self.squares[sq]] += 1
+                if ptype == KING:
+                    self.kings[c] = sq
+        self.piece_count = sum(self.counts)
+        self.key = self.zobrist_key()
+        self.pawn_key = self.pawn_zobrist_key()
+        # Keys of the positions before each move played with make_move
+        self.history = []
+        self.psq_tables = None
+        self.psq_mg = self.psq_eg = 0
+
+    @classmethod
+    def from_state(cls, state):
+        board = cls(state['white_pieces'], state['white_locations'],
+                    state['black_pieces'], state['black_locations'])
+        board.set_castling(state.get('white_moved'), state.get('black_moved'))
+        board.set_side(state.get('turn_step', 0) % 2)
+        return board
+
+    def zobrist_key(self):
+        """Hash the position from scratch; make_move keeps ``key`` equal to this."""
+        key = ZOBRIST_CASTLING[self.castling]
+        if self.side == BLACK:
+            key ^= ZOBRIST_SIDE
+        for sq in iter_bits(self.occupied[WHITE] | self.occupied[BLACK]):
+            key ^= ZOBRIST_PIECES[self.squares[sq]][sq]
+        return key
+
+    def pawn_zobrist_key(self):
+        """Hash of the pawns alone from scratch; make_move keeps ``pawn_key`` equal to this."""
+        key = 0
+        for c in (WHITE, BLACK):
+            code = piece_code(c, PAWN)
+            for sq in iter_bits(self.pieces[c][PAWN]):
+                key ^= ZOBRIST_PIECES[code][sq]
+        return key
+
+    def piece_square_totals(self, tables):
+        """Sum (midgame, endgame) ``tables[code][sq]`` over the pieces from scratch."""
+        mg_table, eg_table = tables
+        mg = eg = 0
+        for sq in iter_bits(self.occupied[WHITE] | self.occupied[BLACK]):
+            code = self.squares[sq]
+            mg += mg_table[code][sq]
+            eg += eg_table[code][sq]
+        return mg, eg
+
+    def set_piece_square_tables(self, tables):
+        """Attach (midgame, endgame) tables indexed [code][sq]; make_move keeps their sums."""
+        self.psq_tables = tables
+        self.psq_mg, self.psq_eg = self.piece_square_totals(tables)
+
+    def set_side(self, c):
+        if c != self.side:
+            self.side = c
+            self.key ^= ZOBRIST_SIDE
+
+    def set_castling(self, white_moved, black_moved):
+        """Derive castling rights from the session's per-piece moved flags."""
+        self.key ^= ZOBRIST_CASTLING[self.castling]
+        self.castling = 0
+        for c, moved in ((WHITE, white_moved), (BLACK, black_moved)):
+            if not moved:
+                continue
+            for side in (CASTLE_KINGSIDE, CASTLE_QUEENSIDE):
+                king_from, _, rook_from, _, _ = CASTLING_PATHS[(c, side)]
+                if (self.squares[king_from] == piece_code(c, KING) and not moved[self.slots[king_from]] and
+                        self.squares[rook_from] == piece_code(c, ROOK) and not moved[self.slots[rook_from]]):
+                    self.castling |= castle_right(c, side)
+        self.key ^= ZOBRIST_CASTLING[self.castling]
+
+    def to_state(self, state):
+        """Write the piece and location lists back into a session-style dict."""
+        for c, color in enumerate(COLORS):
+            pieces = [None] * self.list_sizes[c]
+            locations = [(-1, -1)] * self.list_sizes[c]
+            state[color + '_pieces'] = pieces
+            state[color + '_locations'] = locations
+        for sq in range(64):
+            code = self.squares[sq]
+            if code:
+                color = COLORS[code_color(code)]
+                state[color + '_pieces'][self.slots[sq]] = PIECE_TYPES[code_piece(code)]
+                state[color + '_locations'][self.slots[sq]] = SQUARE_COORDS[sq]
+        return state
+
+    def copy(self):
+        clone = Position.__new__(Position)
+        clone.occupied = self.occupied[:]
+        clone.pieces = [self.pieces[WHITE][:], self.pieces[BLACK][:]]
+        clone.squares = self.squares[:]
+        clone.slots = self.slots[:]
+        clone.list_sizes = self.list_sizes[:]
+        clone.castling = self.castling
+        clone.side = self.side
+        clone.kings = self.kings[:]
+        clone.counts = self.counts[:]
+        clone.piece_count = self.piece_count
+        clone.key = self.key
+        clone.pawn_key = self.pawn_key
+        clone.history = self.history[:]
+        clone.psq_tables = self.psq_tables
+        clone.psq_mg = self.psq_mg
+        clone.psq_eg = self.psq_eg
+        return clone
+
+    def piece_at(self, x, y):
+        """(color, piece name) on a square, or None when it is empty."""
+        code = self.squares[y * 8 + x] if _on_board(x, y) else 0
+        if not code:
+            return None
+        return COLORS[code_color(code)], PIECE_TYPES[code_piece(code)]
+
+    def index_at(self, x, y):
+        """Index of the piece on a square in its side's session lists, or None."""
+        if not _on_board(x, y) or not self.squares[y * 8 + x]:
+            return None
+        return self.slots[y * 8 + x]
+
+    def move_piece(self, from_sq, to_sq):
+        """Move a piece on the mailbox and bitboards.
+
+        Returns the list index of a captured piece, or None.
+        """
+        code = self.squares[from_sq]
+        c = code_color(code)
+        captured_idx = None
+        captured = self.squares[to_sq]
+        if captured:
+            captured_idx = self.slots[to_sq]
+            self.occupied[c ^ 1] &= ~(1 << to_sq)
+            self.pieces[c ^ 1][code_piece(captured)] &= ~(1 << to_sq)
+            self.key ^= ZOBRIST_PIECES[captured][to_sq]
+            self.counts[captured] -= 1
+            self.piece_count -= 1
+            if code_piece(captured) == KING:
+                self.kings[c ^ 1] = None
+        if code_piece(code) == KING:
+            self.kings[c] = to_sq
+        move_bits = (1 << from_sq) | (1 << to_sq)
+        self.occupied[c] ^= move_bits
+        self.pieces[c][code_piece(code)] ^= move_bits
+        self.squares[to_sq] = code
+        self.slots[to_sq] = self.slots[from_sq]
+        self.squares[from_sq] = 0
+        self.key ^= ZOBRIST_PIECES[code][from_sq] ^ ZOBRIST_PIECES[code][to_sq]
+        self.pawn_key = self.pawn_zobrist_key()
+        if self.psq_tables is not None:
+            self.set_piece_square_tables(self.psq_tables)
+        return captured_idx
+
+    def make_move(self, move):
+        """Play an encoded move in place and return what unmake_move needs.
+
+        Captures, castling (the rook jumps to the square the king crossed) and
+        promotion (always to a queen) are handled here; the side to move flips.
+        The castle and promotion flags must be set as move_code would set them.
+        """
+        from_sq = move >> 6 & 63
+        to_sq = move & 63
+        squares = self.squares
+        slots = self.slots
+        code = squares[from_sq]
+        c = code >> 3
+        piece = (code & 7) - 1
+        captured = squares[to_sq]
+        castling = self.castling
+        key = self.key
+        undo = (move, code, captured, slots[to_sq], castling, key, self.pawn_key,
+                self.psq_mg, self.psq_eg)
+        self.history.append(key)
+        own_pieces = self.pieces[c]
+        key ^= ZOBRIST_PIECES[code][from_sq] ^ ZOBRIST_PIECES[code][to_sq] ^ ZOBRIST_SIDE
+        if captured:
+            bit = 1 << to_sq
+            self.occupied[c ^ 1] ^= bit
+            self.pieces[c ^ 1][(captured & 7) - 1] ^= bit
+            key ^= ZOBRIST_PIECES[captured][to_sq]
+            self.counts[captured] -= 1
+            self.piece_count -= 1
+            if captured & 7 == PAWN + 1:
+                self.pawn_key ^= ZOBRIST_PIECES[captured][to_sq]
+            elif captured & 7 == KING + 1:
+                self.kings[c ^ 1] = None
+        move_bits = (1 << from_sq) | (1 << to_sq)
+        self.occupied[c] ^= move_bits
+        own_pieces[piece] ^= move_bits
+        squares[to_sq] = code
+        squares[from_sq] = 0
+        slots[to_sq] = slots[from_sq]
+        if piece == KING:
+            self.kings[c] = to_sq
+            if move & MOVE_CASTLE:
+                rook_from, rook_to = CASTLING_ROOKS[to_sq]
+                rook_bits = (1 << rook_from) | (1 << rook_to)
+                self.occupied[c] ^= rook_bits
+                own_pieces[ROOK] ^= rook_bits
+                rook_code = squares[rook_from]
+                squares[rook_to] = rook_code
+                squares[rook_from] = 0
+                slots[rook_to] = slots[rook_from]
+                key ^= ZOBRIST_PIECES[rook_code][rook_from] ^ ZOBRIST_PIECES[rook_code][rook_to]
+        elif piece == PAWN:
+            if move & MOVE_PROMOTION:
+                own_pieces[PAWN] ^= 1 << to_sq
+                own_pieces[QUEEN] |= 1 << to_sq
+                queen_code = (c << 3) | (QUEEN + 1)
+                squares[to_sq] = queen_code
+                self.counts[code] -= 1
+                self.counts[queen_code] += 1
+                key ^= ZOBRIST_PIECES[code][to_sq] ^ ZOBRIST_PIECES[queen_code][to_sq]
+                self.pawn_key ^= ZOBRIST_PIECES[code][from_sq]
+            else:
+                self.pawn_key ^= ZOBRIST_PIECES[code][from_sq] ^ ZOBRIST_PIECES[code][to_sq]
+        tables = self.psq_tables
+        if tables is not None:
+            # Piece-square sums move by the same delta as the key: the mover's
+            # squares, the captured piece, the castling rook and the promotion
+            mg_table, eg_table = tables
+            new_code = squares[to_sq]
+            mg = self.psq_mg + mg_table[new_code][to_sq] - mg_table[code][from_sq]
+            eg = self.psq_eg + eg_table[new_code][to_sq] - eg_table[code][from_sq]
+            if captured:
+                mg -= mg_table[captured][to_sq]
+                eg -= eg_table[captured][to_sq]
+            if move & MOVE_CASTLE:
+                mg += mg_table[rook_code][rook_to] - mg_table[rook_code][rook_from]
+                eg += eg_table[rook_code][rook_to] - eg_table[rook_code][rook_from]
+            self.psq_mg = mg
+            self.psq_eg = eg
+        self.castling = castling & CASTLING_KEEP[from_sq] & CASTLING_KEEP[to_sq]
+        if self.castling != castling:
+            key ^= ZOBRIST_CASTLING[castling] ^ ZOBRIST_CASTLING[self.castling]
+        self.key = key
+        self.side ^= 1
+        return undo
+
+    def unmake_move(self, undo):
+        """Take back a move played with make_move."""
+        (move, code, captured, captured_slot, castling, key, self.pawn_key,
+         self.psq_mg, self.psq_eg) = undo
+        from_sq = move >> 6 & 63
+        to_sq = move & 63
+        squares = self.squares
+        slots = self.slots
+        c = code >> 3
+        own_pieces = self.pieces[c]
+        piece = (code & 7) - 1
+        # The piece now on to_sq may be a promoted queen rather than the mover
+        if move & MOVE_PROMOTION:
+            self.counts[squares[to_sq]] -= 1
+            self.counts[code] += 1
+        own_pieces[(squares[to_sq] & 7) - 1] ^= 1 << to_sq
+        own_pieces[piece] ^= 1 << from_sq
+        self.occupied[c] ^= (1 << from_sq) | (1 << to_sq)
+        squares[from_sq] = code
+        slots[from_sq] = slots[to_sq]
+        squares[to_sq] = captured
+        slots[to_sq] = captured_slot
+        if captured:
+            bit = 1 << to_sq
+            self.occupied[c ^ 1] ^= bit
+            self.pieces[c ^ 1][(captured & 7) - 1] ^= bit
+            self.counts[captured] += 1
+            self.piece_count += 1
+            if captured & 7 == KING + 1:
+                self.kings[c ^ 1] = to_sq
+        if piece == KING:
+            self.kings[c] = from_sq
+        if move & MOVE_CASTLE:
+            rook_from, rook_to = CASTLING_ROOKS[to_sq]
+            rook_bits = (1 << rook_from) | (1 << rook_to)
+            self.occupied[c] ^= rook_bits
+            own_pieces[ROOK] ^= rook_bits
+            squares[rook_from] = squares[rook_to]
+            squares[rook_to] = 0
+            slots[rook_from] = slots[rook_to]
+        self.castling = castling
+        self.key = key
+        self.history.pop()
+        self.side ^= 1
+
+    def make_null_move(self):
+        """Pass the turn without moving, for null-move pruning; returns the key to restore."""
+        key = self.key
+        self.history.append(key)
+        self.key = key ^ ZOBRIST_SIDE
+        self.side ^= 1
+        return key
+
+    def unmake_null_move(self, key):
+        self.key = key
+        self.history.pop()
+        self.side ^= 1
+
+    def is_repetition(self):
+        """True when this position (side to move included) occurred earlier in ``history``."""
+        return self.key in self.history
+
+    def move_code(self, from_sq, to_sq):
+        """Encode moving the piece on ``from_sq`` to ``to_sq``, with flags read off this position."""
+        code = self.squares[from_sq]
+        flags = MOVE_CAPTURE if self.squares[to_sq] else 0
+        piece = (code & 7) - 1
+        if piece == KING and (to_sq - from_sq == 2 or from_sq - to_sq == 2):
+            flags |= MOVE_CASTLE
+        elif piece == PAWN and (to_sq >= 56 or to_sq < 8):
+            flags |= MOVE_PROMOTION
+        return flags | (from_sq << 6) | to_sq
+
+    def app_move(self, move):
+        """An encoded move in the routes' format: (x, y), or (x, y, 'castle_...') for castling."""
+        from_sq, to_sq = move >> 6 & 63, move & 63
+        x, y = SQUARE_COORDS[to_sq]
+        if move & MOVE_CASTLE:
+            return (x, y, 'castle_kingside' if to_sq > from_sq else 'castle_queenside')
+        return (x, y)
+
+    def set_piece_type(self, sq, piece_name):
+        """Change the piece standing on ``sq`` in place (pawn promotion)."""
+        code = self.squares[sq]
+        c = code_color(code)
+        ptype = PIECE_INDEX[piece_name]
+        self.pieces[c][code_piece(code)] &= ~(1 << sq)
+        self.pieces[c][ptype] |= 1 << sq
+        self.squares[sq] = piece_code(c, ptype)
+        self.counts[code] -= 1
+        self.counts[self.squares[sq]] += 1
+        if ptype == KING:
+            self.kings[c] = sq
+        elif code_piece(code) == KING:
+            self.kings[c] = None
+        self.key ^= ZOBRIST_PIECES[code][sq] ^ ZOBRIST_PIECES[self.squares[sq]][sq]
+        self.pawn_key = self.pawn_zobrist_key()
+        if self.psq_tables is not None:
+            self.set_piece_square_tables(self.psq_tables)
+
+    @property
+    def all_occupied(self):
+        return self.occupied[WHITE] | self.occupied[BLACK]
+
+    def king_square(self, c):
+        return self.kings[c]
+
+    def targets(self, piece_name, position, color):
+        c = color_index(color)
+        return piece_targets(PIECE_INDEX[piece_name], square(*position), c,
+                             self.occupied[c], self.occupied[c ^ 1])
+
+    def moves(self, piece_name, position, color):
+        return to_coords(self.targets(piece_name, position, color))
+
+    def attacks_by(self, c, occupied=None):
+        """Union of every square attacked by side ``c``."""
+        if occupied is None:
+            occupied = self.all_occupied
+        attacks = 0
+        pieces = self.pieces[c]
+        for piece in range(6):
+            for sq in iter_bits(pieces[piece]):
+                attacks |= piece_attacks(piece, sq, c, occupied)
+        return attacks
+
+    def is_square_attacked(self, sq, by_c, occupied=None):
+        """True if side ``by_c`` attacks ``sq``.
+
+        Works backwards from the target square: a knight, pawn or king of the
+        attacking side must stand on the matching pattern around it, and a
+        slider must be the first piece met along a ray cast from it. The
+        cheap leaper patterns are tried first and the search stops at the
+        first hit.
+        """
+        if occupied is None:
+            occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        enemy = self.pieces[by_c]
+        if KNIGHT_ATTACKS[sq] & enemy[KNIGHT]:
+            return True
+        if PAWN_ATTACKS[by_c ^ 1][sq] & enemy[PAWN]:
+            return True
+        if KING_ATTACKS[sq] & enemy[KING]:
+            return True
+        diagonal = enemy[BISHOP] | enemy[QUEEN]
+        if diagonal and bishop_attacks(sq, occupied) & diagonal:
+            return True
+        straight = enemy[ROOK] | enemy[QUEEN]
+        return bool(straight and rook_attacks(sq, occupied) & straight)
+
+    def attackers_to(self, sq, by_c, occupied=None):
+        """Bitboard of every piece of side ``by_c`` attacking ``sq``."""
+        if occupied is None:
+            occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        enemy = self.pieces[by_c]
+        return ((KNIGHT_ATTACKS[sq] & enemy[KNIGHT]) |
+                (PAWN_ATTACKS[by_c ^ 1][sq] & enemy[PAWN]) |
+                (KING_ATTACKS[sq] & enemy[KING]) |
+                (bishop_attacks(sq, occupied) & (enemy[BISHOP] | enemy[QUEEN])) |
+                (rook_attacks(sq, occupied) & (enemy[ROOK] | enemy[QUEEN])))
+
+    def in_check(self, c):
+        king = self.king_square(c)
+        if king is None:
+            return False
+        return self.is_square_attacked(king, c ^ 1)
+
+    def generate_moves(self, c, target_mask=FULL_BOARD):
+        """Pseudo-legal encoded moves for side ``c`` (castling excluded).
+
+        Only moves landing on ``target_mask`` are produced, so passing the
+        enemy occupancy generates captures without building quiet moves.
+        """
+        own = self.occupied[c]
+        enemy = self.occupied[c ^ 1]
+        occupied = own | enemy
+        empty = ~occupied & target_mask
+        enemy &= target_mask
+        pieces = self.pieces[c]
+        moves = []
+        append = moves.append
+        # Pawns are generated set-wise: shift every pawn at once and recover
+        # the origin square from the shift distance.
+        pawns = pieces[PAWN]
+        capture = MOVE_CAPTURE
+        if c == WHITE:
+            last = RANK_MASKS[7]
+            single = (pawns << 8) & ~occupied
+            pawn_sets = ((single & empty, -8, 0), (((single & RANK_MASKS[2]) << 8) & empty, -16, 0),
+                         ((pawns << 9) & NOT_FILE_A & enemy, -9, capture),
+                         ((pawns << 7) & NOT_FILE_H & enemy, -7, capture))
+        else:
+            last = RANK_MASKS[0]
+            single = (pawns >> 8) & ~occupied
+            pawn_sets = ((single & empty, 8, 0), (((single & RANK_MASKS[5]) >> 8) & empty, 16, 0),
+                         ((pawns >> 7) & NOT_FILE_A & enemy, 7, capture),
+                         ((pawns >> 9) & NOT_FILE_H & enemy, 9, capture))
+        for targets, delta, flags in pawn_sets:
+            promoting = targets & last
+            targets ^= promoting
+            while targets:
+                t = targets & -targets
+                to_sq = t.bit_length() - 1
+                append(flags | ((to_sq + delta) << 6) | to_sq)
+                targets ^= t
+            flags |= MOVE_PROMOTION
+            while promoting:
+                t = promoting & -promoting
+                to_sq = t.bit_length() - 1
+                append(flags | ((to_sq + delta) << 6) | to_sq)
+                promoting ^= t
+        for piece, attack in ((KNIGHT, None), (BISHOP, bishop_attacks), (ROOK, rook_attacks),
+                              (QUEEN, queen_attacks), (KING, None)):
+            bb = pieces[piece]
+            while bb:
+                low = bb & -bb
+                sq = low.bit_length() - 1
+                bb ^= low
+                if piece == KNIGHT:
+                    attacks = KNIGHT_ATTACKS[sq]
+                elif piece == KING:
+                    attacks = KING_ATTACKS[sq]
+                else:
+                    attacks = attack(sq, occupied)
+                origin = sq << 6
+                targets = attacks & enemy
+                while targets:
+                    t = targets & -targets
+                    append(capture | origin | (t.bit_length() - 1))
+                    targets ^= t
+                targets = attacks & empty
+                while targets:
+                    t = targets & -targets
+                    append(origin | (t.bit_length() - 1))
+                    targets ^= t
+        return moves
+
+    def generate_captures(self, c):
+        """Pseudo-legal captures for side ``c``, for the quiescence search."""
+        return self.generate_moves(c, self.occupied[c ^ 1])
+
+    def checkers(self, c):
+        """Bitboard of enemy pieces giving check to side ``c``'s king."""
+        king = self.king_square(c)
+        if king is None:
+            return 0
+        return self.attackers_to(king, c ^ 1)
+
+    def pinned(self, c):
+        """Map of pinned piece square -> squares it may still move to along the pin."""
+        king = self.king_square(c)
+        pins = {}
+        if king is None:
+            return pins
+        own = self.occupied[c]
+        occupied = self.all_occupied
+        enemy = self.pieces[c ^ 1]
+        straight = enemy[ROOK] | enemy[QUEEN]
+        diagonal = enemy[BISHOP] | enemy[QUEEN]
+        for d in DIRECTIONS:
+            sliders = straight if d[0] == 0 or d[1] == 0 else diagonal
+            ray = RAYS[d]
+            if not ray[king] & sliders:
+                continue
+            nearest = lsb if d in POSITIVE_DIRECTIONS else msb
+            blockers = ray[king] & occupied
+            if not blockers:
+                continue
+            first = nearest(blockers)
+            if not own >> first & 1:
+                continue
+            beyond = ray[first] & occupied
+            if beyond:
+                second = nearest(beyond)
+                if sliders >> second & 1:
+                    pins[first] = BETWEEN[king][second] | (1 << second)
+        return pins
+
+    def castle_moves(self, c):
+        """Encoded king castling moves for side ``c``."""
+        moves = []
+        occupied = self.all_occupied
+        for side in (CASTLE_KINGSIDE, CASTLE_QUEENSIDE):
+            if not self.castling & castle_right(c, side):
+                continue
+            king_from, king_to, _, _, path = CASTLING_PATHS[(c, side)]
+            if occupied & path:
+                continue
+            # Squares the king crosses are tested with it lifted off its start square
+            lifted = occupied ^ (1 << king_from)
+            if not any(self.is_square_attacked(sq, c ^ 1, lifted) for sq in (king_from, *iter_bits(path))):
+                moves.append(MOVE_CASTLE | (king_from << 6) | king_to)
+        return moves
+
+    def is_pseudo_legal(self, c, move):
+        """Whether generate_moves or castle_moves would produce ``move`` for side ``c``.
+
+        Lets a remembered move (hash, PV, killer) be tried at a node before
+        anything there is generated.
+        """
+        from_sq = move >> 6 & 63
+        to_sq = move & 63
+        code = self.squares[from_sq]
+        if not code or code >> 3 != c or move != self.move_code(from_sq, to_sq):
+            return False
+        piece = (code & 7) - 1
+        if piece_targets(piece, from_sq, c, self.occupied[c], self.occupied[c ^ 1]) >> to_sq & 1:
+            return True
+        return piece == KING and bool(self.castling) and move in self.castle_moves(c)
+
+    def legal_moves(self, c):
+        """Legal encoded moves for side ``c``, castling included.
+
+        Pins and check evasions are worked out from the king's square, so no
+        move has to be played out and tested afterwards.
+        """
+        king = self.king_square(c)
+        if king is None:
+            return self.generate_moves(c)
+        own = self.occupied[c]
+        # The king is lifted off the board so it cannot hide behind itself
+        # from a slider that is checking it.
+        lifted = self.all_occupied ^ (1 << king)
+        enemy = self.occupied[c ^ 1]
+        moves = [(MOVE_CAPTURE if enemy >> to_sq & 1 else 0) | (king << 6) | to_sq
+                 for to_sq in iter_bits(KING_ATTACKS[king] & ~own)
+                 if not self.is_square_attacked(to_sq, c ^ 1, lifted)]
+        checkers = self.checkers(c)
+        if checkers & (checkers - 1):
+            return moves  # double check: only the king can move
+        if checkers:
+            checker = lsb(checkers)
+            evasions = checkers | BETWEEN[king][checker]
+        else:
+            evasions = FULL_BOARD
+            moves.extend(self.castle_moves(c))
+        pins = self.pinned(c)
+        for move in self.generate_moves(c):
+            from_sq = move >> 6 & 63
+            to_sq = move & 63
+            if from_sq == king or not evasions >> to_sq & 1:
+                continue
+            pin = pins.get(from_sq)
+            if pin is not None and not pin >> to_sq & 1:
+                continue
+            moves.append(move)
+        return moves
@@ -0,0 +1,184 @@
+"""Perft: count the leaf nodes of the legal move tree to a fixed depth.
+
+Perft numbers are the standard way to prove a move generator correct, and
+they make a convenient throughput benchmark. Run::
+
+    python perft.py                      # every stored position, engine generator
+    python perft.py start 5              # one position, one depth
+    python perft.py open 3 --divide      # per-root-move counts for bisecting
+    python perft.py --backend app        # the routes' generators instead
+
+Backends:
+
+* ``engine`` -- Position.legal_moves, which check_valid_moves and check_mate use
+* ``app`` -- check_options (pseudo-legal, castling via check_king) run inside a
+  request context, keeping the moves that leave the mover's king safe
+* ``ai`` -- the moves ChessAI's minimax searches: search_moves, minus those
+  is_king_vulnerable rejects
+
+Every backend plays moves with Position.make_move, so castling rook jumps and
+promotions follow the game's rules. This variant has no en passant, so counts
+differ from published perft tables once a double push can be taken that way.
+"""
+import argparse
+import sys
+import time
+
+import engine
+from bench import load_placement
+
+# name -> (FEN piece placement, side to move, {depth: leaf count}).
+# The start position mirrors init_game_state; its counts match standard chess
+# up to depth 4, and depth 5 is the standard 4,865,609 less its 258 en passant
+# captures. The other counts were checked to depth 3 against the original
+# list-scanning generators. Kings and rooks on their home squares keep their
+# castling rights.
+PERFT_POSITIONS = {
+    'start': ('rnbkqbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBKQBNR', engine.WHITE,
+              {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865351}),
+    'castling': ('r2k3r/pppq1ppp/2n1bn2/4p3/4P3/2N1BN2/PPPQ1PPP/R2K3R', engine.WHITE,
+                 {1: 41, 2: 1617, 3: 63747, 4: 2479120}),
+    'middlegame': ('r2k1b1r/ppp1qppp/2np1n2/4p1B1/2B1P1b1/2NP1N2/PPP1QPPP/R2K3R', engine.WHITE,
+                   {1: 45, 2: 1576, 3: 67942, 4: 2308893}),
+    'promotion': ('n1n5/PPPk4/8/8/8/8/4Kppp/5N1N', engine.BLACK,
+                  {1: 15, 2: 210, 3: 3253, 4: 47828, 5: 807048}),
+    'endgame': ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8', engine.WHITE,
+                {1: 14, 2: 191, 3: 2810, 4: 43087, 5: 671300}),
+}
+
+
+def load_position(name):
+    placement, side, _ = PERFT_POSITIONS[name]
+    state = load_placement(placement)
+    state['white_moved'] = [False] * len(state['white_pieces'])
+    state['black_moved'] = [False] * len(state['black_pieces'])
+    state['turn_step'] = side
+    return state
+
+
+def engine_moves(board):
+    return board.legal_moves(board.side)
+
+
+def ai_moves(ai):
+    def generate(board):
+        color = engine.COLORS[board.side]
+        moves = []
+        for move in ai.search_moves(board, board.side):
+            undo = board.make_move(move)
+            if not ai.is_king_vulnerable(board, color):
+                moves.append(move)
+            board.unmake_move(undo)
+        return moves
+    return generate
+
+
+def app_moves(app_module):
+    def generate(board):
+        c = board.side
+        color = engine.COLORS[c]
+        state = _session_state(board)
+        with app_module.app.test_request_context():
+            app_module.session['game_state'] = state
+            options = app_module.check_options(state[color + '_pieces'], state[color + '_locations'], color)
+        moves = []
+        for location, piece_moves in zip(state[color + '_locations'], options):
+            for move in piece_moves:
+                code = board.move_code(engine.square(*location), engine.square(*move[:2]))
+                undo = board.make_move(code)
+                if not board.in_check(c):
+                    moves.append(code)
+                board.unmake_move(undo)
+        return moves
+    return generate
+
+
+def _session_state(board):
+    """Session-style dict for a board, with moved flags that reproduce its castling rights."""
+    state = board.to_state({'turn_step': board.side})
+    for c, color in enumerate(engine.COLORS):
+        moved = [True] * board.list_sizes[c]
+        for side in (engine.CASTLE_KINGSIDE, engine.CASTLE_QUEENSIDE):
+            if board.castling & engine.castle_right(c, side):
+                king_from, _, rook_from, _, _ = engine.CASTLING_PATHS[(c, side)]
+                moved[board.slots[king_from]] = False
+                moved[board.slots[rook_from]] = False
+        state[color + '_moved'] = moved
+    return state
+
+
+def make_generator(backend):
+    if backend == 'engine':
+        return engine_moves
+    if backend == 'ai':
+        from ai_agent import ChessAI
+        return ai_moves(ChessAI('hard'))
+    if backend == 'app':
+        import app
+        return app_moves(app)
+    raise ValueError(f'unknown backend {backend!r}')
+
+
+def perft(board, depth, generate):
+    moves = generate(board)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        undo = board.make_move(move)
+        nodes += perft(board, depth - 1, generate)
+        board.unmake_move(undo)
+    return nodes
+
+
+def divide(board, depth, generate):
+    """Leaf counts below each root move, keyed by ((x, y), (x, y))."""
+    counts = {}
+    for move in generate(board):
+        undo = board.make_move(move)
+        counts[(engine.SQUARE_COORDS[engine.move_from(move)], engine.SQUARE_COORDS[engine.move_to(move)])] = \
+            perft(board, depth - 1, generate) if depth > 1 else 1
+        board.unmake_move(undo)
+    return counts
+
+
+def run(names, depths, backend, show_divide=False):
+    generate = make_generator(backend)
+    failures = 0
+    print(f"{'position':<12}{'depth':>6}{'nodes':>12}{'expected':>12}{'nodes/s':>12}")
+    for name in names:
+        expected = PERFT_POSITIONS[name][2]
+        for depth in depths or sorted(expected):
+            board = engine.Position.from_state(load_position(name))
+            start = time.perf_counter()
+            if show_divide:
+                counts = divide(board, depth, generate)
+                nodes = sum(counts.values())
+            else:
+                nodes = perft(board, depth, generate)
+            elapsed = time.perf_counter() - start
+            want = expected.get(depth)
+            status = '' if want is None or want == nodes else '  MISMATCH'
+            failures += bool(status)
+            print(f"{name:<12}{depth:>6}{nodes:>12,}{want if want is not None else '-':>12}"
+                  f"{nodes / elapsed if elapsed else 0:>12,.0f}{status}")
+            if show_divide:
+                for move, count in sorted(counts.items()):
+                    print(f'    {move[0]} -> {move[1]}: {count}')
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('position', nargs='?', choices=sorted(PERFT_POSITIONS))
+    parser.add_argument('depth', nargs='?', type=int)
+    parser.add_argument('--backend', choices=('engine', 'app', 'ai'), default='engine')
+    parser.add_argument('--divide', action='store_true', help='print the count below every root move')
+    args = parser.parse_args(argv)
+    names = [args.position] if args.position else list(PERFT_POSITIONS)
+    depths = [args.depth] if args.depth else None
+    return 1 if run(names, depths, args.backend, args.divide) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
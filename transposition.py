@@ -0,0 +1,182 @@
+"""Fixed-size transposition table for ChessAI's search.
+
+Entries live in a flat array of unsigned 64-bit words instead of a dict, so
+the table never grows, never needs a pause to evict, and can sit on top of
+any writable buffer. Two words make an entry:
+
+* word 0 -- the Zobrist key XOR word 1, so a half-written entry fails the
+  key check instead of returning another position's data
+* word 1 -- the packed data: best move (16 bits), score (32), depth (8),
+  bound (2) and search age (6)
+
+Buckets hold two entries. The first keeps the deepest result and is only
+overwritten by an equal or deeper search, or one from an older search. The
+second always takes whatever the first turned away. Probes check the first
+entry first, so a deep result shadows a shallower one for the same key.
+
+PawnHashTable uses the same two-word layout for the evaluation's pawn
+structure terms, direct-mapped on the pawn-only key: new entries always
+replace old ones, since pawn structures recur far more than they collide.
+EvalCache does the same for whole-position evaluations.
+"""
+from array import array
+
+EXACT, LOWER, UPPER = 1, 2, 3
+
+ENTRY_WORDS = 2
+BUCKET_WORDS = 2 * ENTRY_WORDS
+BUCKET_BYTES = BUCKET_WORDS * 8
+
+SCORE_SHIFT = 16
+DEPTH_SHIFT = 48
+BOUND_SHIFT = 56
+AGE_SHIFT = 58
+SCORE_OFFSET = 1 << 31
+SCORE_LIMIT = (1 << 31) - 1
+DEPTH_OFFSET = 128
+AGE_MASK = 0x3F
+WORD_MASK = (1 << 64) - 1
+
+
+def _clamp_score(score):
+    # Searches report +/-inf for positions without a playable move
+    if score >= SCORE_LIMIT:
+        return SCORE_LIMIT
+    if score <= -SCORE_LIMIT:
+        return -SCORE_LIMIT
+    return int(score)
+
+
+class TranspositionTable:
+    """Bucketed table sized in megabytes (rounded down to a power-of-two bucket count)."""
+
+    def __init__(self, size_mb=16, buffer=None):
+        if buffer is None:
+            buckets = 1
+            while buckets * 2 * BUCKET_BYTES <= size_mb * 1024 * 1024:
+                buckets *= 2
+            self.words = array('Q', bytes(buckets * BUCKET_BYTES))
+        else:
+            # A caller-owned buffer, e.g. shared memory, already sized in whole buckets
+            self.words = memoryview(buffer).cast('B').cast('Q')
+            buckets = len(self.words) // BUCKET_WORDS
+        self.mask = buckets - 1
+        self.age = 0
+
+    @property
+    def size_bytes(self):
+        return (self.mask + 1) * BUCKET_BYTES
+
+    def clear(self):
+        memoryview(self.words).cast('B')[:] = bytes(self.size_bytes)
+        self.age = 0
+
+    def new_search(self):
+        """Start a new search generation; older entries become preferred victims."""
+        self.age = (self.age + 1) & AGE_MASK
+
+    def probe(self, key):
+        """Return (depth, score, bound, best move) stored for ``key``, or None."""
+        words = self.words
+        index = (key & self.mask) * BUCKET_WORDS
+        for slot in (index, index + ENTRY_WORDS):
+            data = words[slot + 1]
+            if data and words[slot] ^ data == key:
+                score = ((data >> SCORE_SHIFT) & 0xFFFFFFFF) - SCORE_OFFSET
+                depth = ((data >> DEPTH_SHIFT) & 0xFF) - DEPTH_OFFSET
+                bound = (data >> BOUND_SHIFT) & 3
+                return depth, score, bound, (data & 0xFFFF) or None
+        return None
+
+    def store(self, key, depth, score, bound, move=None):
+        words = self.words
+        index = (key & self.mask) * BUCKET_WORDS
+        # Moves are engine's 16-bit encoding, stored as they are; 0 means none
+        packed_move = move or 0
+        if not packed_move:
+            # Keep the best move a shallower search already found for this position
+            previous = self.probe(key)
+            if previous is not None:
+                packed_move = previous[3] or 0
+        data = (packed_move |
+                ((_clamp_score(score) + SCORE_OFFSET) << SCORE_SHIFT) |
+                ((depth + DEPTH_OFFSET) << DEPTH_SHIFT) |
+                (bound << BOUND_SHIFT) |
+                (self.age << AGE_SHIFT))
+        first = words[index + 1]
+        if (not first or ((first >> AGE_SHIFT) & AGE_MASK) != self.age or
+                depth >= ((first >> DEPTH_SHIFT) & 0xFF) - DEPTH_OFFSET):
+            slot = index
+        else:
+            slot = index + ENTRY_WORDS
+        words[slot] = (key ^ data) & WORD_MASK
+        words[slot + 1] = data
+
+
+CACHE_ENTRY_BYTES = ENTRY_WORDS * 8
+PAWN_SCORE_SHIFT = 8
+
+
+class _DirectMappedCache:
+    """One two-word entry per slot, sized in kilobytes, counting hits and misses."""
+
+    def __init__(self, size_kb=256):
+        entries = 1
+        while entries * 2 * CACHE_ENTRY_BYTES <= size_kb * 1024:
+            entries *= 2
+        self.words = array('Q', bytes(entries * CACHE_ENTRY_BYTES))
+        self.mask = entries - 1
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def size_bytes(self):
+        return (self.mask + 1) * CACHE_ENTRY_BYTES
+
+    def clear(self):
+        memoryview(self.words).cast('B')[:] = bytes(self.size_bytes)
+        self.hits = self.misses = 0
+
+    def _probe(self, key):
+        words = self.words
+        slot = (key & self.mask) * ENTRY_WORDS
+        data = words[slot + 1]
+        if data and words[slot] ^ data == key:
+            self.hits += 1
+            return data
+        self.misses += 1
+        return 0
+
+    def _store(self, key, data):
+        slot = (key & self.mask) * ENTRY_WORDS
+        self.words[slot] = key ^ data
+        self.words[slot + 1] = data
+
+
+class PawnHashTable(_DirectMappedCache):
+    """Pawn-structure scores keyed by the pawn-only hash."""
+
+    def probe(self, key):
+        """Return (score, open files) stored for ``key``, or None."""
+        data = self._probe(key)
+        if not data:
+            return None
+        return (data >> PAWN_SCORE_SHIFT) - SCORE_OFFSET, data & 0xFF
+
+    def store(self, key, score, open_files):
+        """Cache a score and the 8-bit mask of files without pawns for ``key``."""
+        self._store(key, ((_clamp_score(score) + SCORE_OFFSET) << PAWN_SCORE_SHIFT) | open_files)
+
+
+class EvalCache(_DirectMappedCache):
+    """Static evaluations keyed by position hash."""
+
+    def probe(self, key):
+        """Return the score stored for ``key``, or None."""
+        data = self._probe(key)
+        if not data:
+            return None
+        return data - SCORE_OFFSET
+
+    def store(self, key, score):
+        self._store(key, _clamp_score(score) + SCORE_OFFSET)